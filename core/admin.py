@@ -0,0 +1,92 @@
+import json
+import os
+
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+
+from .models import ProfileCapture
+
+
+class ProfileCaptureAdmin(admin.ModelAdmin):
+    """
+    Профили запросов только для просмотра: записи создаёт
+    ProfilerMiddleware, а не форма админки. Дамп лежит в закрытом
+    хранилище и скачивается через profile_download.
+    """
+    list_display = (
+        'created', 'method', 'path', 'url_name', 'status', 'duration_ms',
+        'query_count', 'db_time_ms', 'user',
+    )
+    list_filter = ('url_name',)
+    search_fields = ('path',)
+    list_select_related = ('user',)
+    fields = (
+        'created', 'user', 'method', 'path', 'url_name', 'status',
+        'duration_ms', 'query_count', 'db_time_ms', 'profile_file',
+        'top_functions', 'top_allocations', 'query_timeline',
+    )
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:object_id>/profile/',
+                self.admin_site.admin_view(self.profile_download),
+                name='core_profilecapture_profile',
+            ),
+        ] + super().get_urls()
+
+    def profile_download(self, request, object_id):
+        capture = get_object_or_404(ProfileCapture, pk=object_id)
+        if not self.has_view_permission(request, capture):
+            raise Http404
+        try:
+            dump = capture.profile.open('rb')
+        except FileNotFoundError:
+            raise Http404
+        return FileResponse(
+            dump, as_attachment=True,
+            filename=os.path.basename(capture.profile.name),
+            content_type='application/octet-stream',
+        )
+
+    def profile_file(self, obj):
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse('admin:core_profilecapture_profile', args=[obj.pk]),
+            os.path.basename(obj.profile.name),
+        )
+
+    def top_functions(self, obj):
+        return format_html('<pre>{}</pre>', obj.functions)
+
+    def top_allocations(self, obj):
+        return format_html('<pre>{}</pre>', obj.allocations or '-')
+
+    def query_timeline(self, obj):
+        rows = format_html_join(
+            '\n', '<tr><td>{}</td><td>{}</td><td>{}</td></tr>',
+            (
+                (
+                    f'{query["start_ms"]:.1f}', f'{query["duration_ms"]:.1f}',
+                    query['sql'],
+                )
+                for query in json.loads(obj.queries)
+            ),
+        )
+        return format_html(
+            '<table><tr><th>начало, мс</th><th>мс</th><th>SQL</th></tr>'
+            '{}</table>', rows,
+        )
+
+
+admin.site.register(ProfileCapture, ProfileCaptureAdmin)
@@ -0,0 +1,382 @@
+"""
+Замер задержек вьюх: запросы прогоняются через WSGIHandler в том же
+процессе, со всеми middleware, но без сети и веб-сервера.
+
+Сценарий — это маршрут с методом, данными и пользователем. Для каждого
+сценария считаются перцентили задержки, среднее число SQL-запросов и
+размер ответа. Результаты сохраняются в JSON и сравниваются с базовым
+замером, сохранённым раньше.
+
+LoadTest вместо задержки отдельных вьюх меряет пропускную способность:
+сценарии выполняются одновременно из нескольких потоков, как под
+многопоточным веб-сервером.
+
+CacheBenchmark сравнивает бэкенды кэша: скорость операций в одном
+процессе и долю попаданий, когда ключи пишут разные процессы.
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from itertools import cycle
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.signals import (
+    got_request_exception, request_finished, request_started,
+)
+from django.db import (
+    DEFAULT_DB_ALIAS, close_old_connections, connections, transaction,
+)
+from django.test import Client, RequestFactory
+from django.utils.crypto import get_random_string
+from django.utils.module_loading import import_string
+
+from .queries import QueryRecorder
+
+PERCENTILES = (50, 95, 99)
+
+
+class Scenario:
+    def __init__(self, name, path, method='get', data=None, user=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data or {}
+        self.user = user
+
+
+def percentile(values, rank):
+    """Перцентиль по ближайшему рангу; values должны быть отсортированы."""
+    if not values:
+        return 0.0
+    index = max(int(round(rank / 100 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+@contextmanager
+def persistent_connection():
+    """
+    WSGIHandler закрывает соединение с БД после каждого запроса. Как и
+    тестовый клиент, на время замера оставляем соединение открытым:
+    иначе откат изменяющих запросов был бы невозможен.
+    """
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        yield
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+
+
+class Benchmark:
+    def __init__(self, scenarios, iterations=50, warmup=5):
+        self.scenarios = scenarios
+        self.iterations = iterations
+        self.warmup = warmup
+        self.handler = WSGIHandler()
+        self.factory = RequestFactory()
+        self.csrf_token = get_random_string(64)
+        self._cookies = {}
+
+    def run(self):
+        results = {}
+        with persistent_connection():
+            for scenario in self.scenarios:
+                for _ in range(self.warmup):
+                    self.request(scenario)
+                samples = [
+                    self.request(scenario) for _ in range(self.iterations)
+                ]
+                results[scenario.name] = self.summarize(scenario, samples)
+        return results
+
+    def request(self, scenario):
+        """Один запрос: (статус, секунды, число запросов к БД, байты)."""
+        environ = self.environ(scenario)
+        # Изменяющие запросы откатываются, чтобы все итерации работали
+        # с одними и теми же данными
+        writes = scenario.method != 'get'
+        with transaction.atomic() if writes else nullcontext():
+            with QueryRecorder() as recorder:
+                started = time.perf_counter()
+                status, size = self.send(environ)
+                elapsed = time.perf_counter() - started
+            if writes:
+                transaction.set_rollback(True)
+        return status, elapsed, len(recorder), size
+
+    def environ(self, scenario):
+        return getattr(self.factory, scenario.method)(
+            scenario.path, scenario.data,
+            HTTP_COOKIE=self.cookies(scenario.user),
+            HTTP_X_CSRFTOKEN=self.csrf_token,
+        ).environ
+
+    def send(self, environ):
+        """Прогоняет запрос через обработчик: (статус, байты ответа)."""
+        status = []
+
+        def start_response(line, headers, exc_info=None):
+            status.append(int(line.split(' ', 1)[0]))
+
+        response = self.handler(environ, start_response)
+        size = sum(len(chunk) for chunk in response)
+        response.close()
+        return status[0], size
+
+    def cookies(self, user):
+        if user is None:
+            return f'{settings.CSRF_COOKIE_NAME}={self.csrf_token}'
+        if user.pk not in self._cookies:
+            client = Client()
+            client.force_login(user)
+            session = client.cookies[settings.SESSION_COOKIE_NAME].value
+            self._cookies[user.pk] = (
+                f'{settings.CSRF_COOKIE_NAME}={self.csrf_token}; '
+                f'{settings.SESSION_COOKIE_NAME}={session}'
+            )
+        return self._cookies[user.pk]
+
+    def summarize(self, scenario, samples):
+        statuses, latencies, queries, sizes = zip(*samples)
+        latencies = sorted(latencies)
+        summary = {
+            'method': scenario.method.upper(),
+            'path': scenario.path,
+            'requests': len(samples),
+            'status': sorted(set(statuses)),
+            'queries': sum(queries) / len(samples),
+            'bytes': sum(sizes) // len(samples),
+        }
+        for rank in PERCENTILES:
+            summary[f'p{rank}_ms'] = round(
+                percentile(latencies, rank) * 1000, 3
+            )
+        return summary
+
+
+class LoadTest(Benchmark):
+    """
+    Каждый из threads потоков в течение duration секунд выполняет
+    сценарии по кругу, начиная со своего смещения. В отличие от Benchmark
+    изменения не откатываются, а соединения с БД закрываются после
+    запроса или переиспользуются согласно CONN_MAX_AGE, как под
+    веб-сервером.
+    """
+
+    def __init__(self, scenarios, threads=8, duration=10.0):
+        super().__init__(scenarios)
+        self.threads = threads
+        self.duration = duration
+        self._lock = threading.Lock()
+        self._samples = []
+        self._errors = Counter()
+
+    def run(self):
+        # Сессии создаются до начала замера
+        for scenario in self.scenarios:
+            self.cookies(scenario.user)
+        self._samples = []
+        self._errors = Counter()
+        deadline = time.perf_counter() + self.duration
+        workers = [
+            threading.Thread(target=self.worker, args=(offset, deadline))
+            for offset in range(self.threads)
+        ]
+        got_request_exception.connect(self._record_exception)
+        try:
+            started = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            got_request_exception.disconnect(self._record_exception)
+        return self.summarize_load(elapsed)
+
+    def worker(self, offset, deadline):
+        shift = offset % len(self.scenarios)
+        scenarios = cycle(self.scenarios[shift:] + self.scenarios[:shift])
+        samples = []
+        try:
+            while time.perf_counter() < deadline:
+                scenario = next(scenarios)
+                environ = self.environ(scenario)
+                started = time.perf_counter()
+                status, _ = self.send(environ)
+                samples.append(
+                    (scenario.name, status, time.perf_counter() - started)
+                )
+        finally:
+            connections.close_all()
+            with self._lock:
+                self._samples.extend(samples)
+
+    def _record_exception(self, sender, **kwargs):
+        error = sys.exc_info()[1]
+        with self._lock:
+            self._errors[f'{type(error).__name__}: {error}'] += 1
+
+    def summarize_load(self, elapsed):
+        latencies = sorted(sample[2] for sample in self._samples)
+        by_scenario = {}
+        for name, status, latency in self._samples:
+            by_scenario.setdefault(name, []).append(latency)
+        summary = {
+            'threads': self.threads,
+            'seconds': round(elapsed, 3),
+            'requests': len(self._samples),
+            'throughput_rps': round(len(self._samples) / elapsed, 1),
+            'status': dict(sorted(Counter(
+                str(sample[1]) for sample in self._samples
+            ).items())),
+            'errors': dict(self._errors),
+        }
+        for rank in PERCENTILES:
+            summary[f'p{rank}_ms'] = round(
+                percentile(latencies, rank) * 1000, 3
+            )
+        summary['scenarios'] = {
+            name: {
+                'requests': len(values),
+                'p95_ms': round(percentile(sorted(values), 95) * 1000, 3),
+            }
+            for name, values in by_scenario.items()
+        }
+        return summary
+
+
+@contextmanager
+def database_settings(overrides, using=DEFAULT_DB_ALIAS):
+    """
+    Временно меняет настройки базы (CONN_MAX_AGE, OPTIONS) для всех
+    потоков. Соединение закрывается до и после, чтобы новые настройки
+    и PRAGMA применились при следующем подключении.
+    """
+    settings_dict = connections.databases[using]
+    saved = {key: settings_dict.get(key) for key in overrides}
+    connections[using].close()
+    settings_dict.update(overrides)
+    try:
+        yield
+    finally:
+        connections[using].close()
+        settings_dict.update(saved)
+
+
+def _cache_worker(cache, own, keys, barrier, results):
+    """Процесс пишет свою долю ключей, затем читает все ключи."""
+    value = os.urandom(len(own[0][1])) if own else b''
+    for key, _ in own:
+        cache.set(key, value)
+    barrier.wait()
+    started = time.perf_counter()
+    hits = sum(cache.get(key) is not None for key in keys)
+    results.put((hits, len(keys), time.perf_counter() - started))
+
+
+class CacheBenchmark:
+    """
+    Для каждого бэкенда: операции в секунду для set, get и incr в одном
+    процессе, затем processes процессов пишут по своей доле ключей и
+    читают все ключи. У кэша в памяти процесса доля попаданий падает
+    до 1/processes, у общего кэша остаётся полной.
+    """
+
+    def __init__(self, backends, keys=1000, size=20000, processes=4):
+        self.backends = backends
+        self.keys = [f'bench:{number}' for number in range(keys)]
+        self.value = os.urandom(size)
+        self.processes = processes
+
+    @staticmethod
+    def create(params):
+        return import_string(params['BACKEND'])(
+            params.get('LOCATION', ''), params
+        )
+
+    def run(self):
+        return {
+            name: self.measure(self.create(params))
+            for name, params in self.backends.items()
+        }
+
+    def measure(self, cache):
+        cache.clear()
+        result = {
+            'set_ops': self.rate(lambda key: cache.set(key, self.value)),
+            'get_ops': self.rate(cache.get),
+        }
+        cache.set('bench:counter', 0)
+        result['incr_ops'] = self.rate(
+            lambda key: cache.incr('bench:counter')
+        )
+        cache.clear()
+        result.update(self.shared(cache))
+        cache.clear()
+        return result
+
+    def rate(self, operation):
+        started = time.perf_counter()
+        for key in self.keys:
+            operation(key)
+        return round(len(self.keys) / (time.perf_counter() - started))
+
+    def shared(self, cache):
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(self.processes)
+        results = context.Queue()
+        workers = [
+            context.Process(target=_cache_worker, args=(
+                cache,
+                [(key, self.value)
+                 for key in self.keys[number::self.processes]],
+                self.keys, barrier, results,
+            ))
+            for number in range(self.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        samples = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        hits = sum(sample[0] for sample in samples)
+        reads = sum(sample[1] for sample in samples)
+        return {
+            'shared_hit_rate': round(hits / reads, 3),
+            'shared_get_ops': round(
+                reads / max(sample[2] for sample in samples)
+            ),
+        }
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Регрессии относительно базового замера: p95 выросла больше чем
+    на threshold, запросов стало больше или изменился статус ответа.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(
+                f'{name}: p95 {previous["p95_ms"]} -> {current["p95_ms"]} мс'
+            )
+        if current['queries'] > previous['queries']:
+            regressions.append(
+                f'{name}: запросов {previous["queries"]} -> '
+                f'{current["queries"]}'
+            )
+        if current['status'] != previous['status']:
+            regressions.append(
+                f'{name}: статус {previous["status"]} -> {current["status"]}'
+            )
+    return regressions
@@ -0,0 +1,276 @@
+"""
+Кэш в файле SQLite, общий для всех процессов на одном сервере.
+
+LocMemCache держит отдельную копию в каждом процессе: страницы лент
+дублируются в памяти, а доля попаданий падает с ростом числа воркеров.
+Здесь все процессы читают один файл в режиме WAL, так что чтения не
+блокируют друг друга и запись.
+
+Размер ограничен OPTIONS['MAX_SIZE'] (байты значений) и MAX_ENTRIES.
+При превышении сначала удаляются просроченные записи, затем давно
+не читанные (LRU), пока не останется (1 - 1/CULL_FREQUENCY) от лимита.
+Время последнего чтения обновляется не чаще раза в ACCESS_RESOLUTION
+секунд, чтобы горячие ключи не превращали каждое чтение в запись.
+
+Целые числа хранятся как INTEGER, поэтому incr атомарен между
+процессами; остальные значения сериализуются pickle.
+"""
+import math
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache_entry (
+    key TEXT NOT NULL UNIQUE,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_entry_accessed ON cache_entry (accessed);
+CREATE INDEX IF NOT EXISTS cache_entry_expires ON cache_entry (expires);
+CREATE TABLE IF NOT EXISTS cache_total (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_total VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_entry_ai AFTER INSERT ON cache_entry BEGIN
+    UPDATE cache_total SET entries = entries + 1, size = size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entry_ad AFTER DELETE ON cache_entry BEGIN
+    UPDATE cache_total SET entries = entries - 1, size = size - old.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entry_au AFTER UPDATE OF size
+ON cache_entry BEGIN
+    UPDATE cache_total SET size = size - old.size + new.size;
+END;
+'''
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self.access_resolution = float(options.get('ACCESS_RESOLUTION', 1))
+        self.busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+
+    def _connection(self):
+        # Соединение своё у каждого потока и у каждого процесса после fork
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.location, timeout=self.busy_timeout,
+                isolation_level=None, check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode = wal')
+            connection.execute('PRAGMA synchronous = normal')
+            # Чтение страниц через mmap без копирования в кэш страниц SQLite
+            connection.execute(f'PRAGMA mmap_size = {self.max_size * 2}')
+            connection.executescript(SCHEMA)
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    @staticmethod
+    def _dump(value):
+        if type(value) is int:
+            return value, 8
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return data, len(data)
+
+    @staticmethod
+    def _load(value):
+        return value if type(value) is int else pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        data, size = self._dump(value)
+        now = time.time()
+        cursor = self._connection().execute(
+            'INSERT INTO cache_entry VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'size = excluded.size, expires = excluded.expires, '
+            'accessed = excluded.accessed '
+            'WHERE cache_entry.expires <= excluded.accessed',
+            (key, data, size, self.get_backend_timeout(timeout), now),
+        )
+        added = cursor.rowcount == 1
+        if added:
+            self._cull()
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        found = self._get_many([key])
+        return found[key] if key in found else default
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        found = self._get_many(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+
+    def _get_many(self, keys):
+        now = time.time()
+        connection = self._connection()
+        found = {}
+        stale = []
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = connection.execute(
+                'SELECT key, value, expires, accessed FROM cache_entry '
+                f'WHERE key IN ({", ".join("?" * len(chunk))})',
+                chunk,
+            )
+            for key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    continue
+                found[key] = self._load(value)
+                if accessed < now - self.access_resolution:
+                    stale.append(key)
+        if stale:
+            connection.executemany(
+                'UPDATE cache_entry SET accessed = ? WHERE key = ?',
+                [(now, key) for key in stale],
+            )
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._set_many(
+            [(self._key(key, version), value)],
+            self.get_backend_timeout(timeout),
+        )
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._set_many(
+            [(self._key(key, version), value) for key, value in data.items()],
+            self.get_backend_timeout(timeout),
+        )
+        return []
+
+    def _set_many(self, items, expires):
+        now = time.time()
+        rows = []
+        for key, value in items:
+            data, size = self._dump(value)
+            rows.append((key, data, size, expires, now))
+        # Не INSERT OR REPLACE: удаление при замене не запускает триггер
+        # счётчиков без recursive_triggers
+        self._connection().executemany(
+            'INSERT INTO cache_entry VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'size = excluded.size, expires = excluded.expires, '
+            'accessed = excluded.accessed',
+            rows,
+        )
+        self._cull()
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._connection().execute(
+            'UPDATE cache_entry SET expires = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        cursor = self._connection().execute(
+            'DELETE FROM cache_entry WHERE key = ?', (key,)
+        )
+        return cursor.rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        self._connection().executemany(
+            'DELETE FROM cache_entry WHERE key = ?',
+            [(self._key(key, version),) for key in keys],
+        )
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache_entry '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def incr(self, key, delta=1, version=None):
+        row = self._connection().execute(
+            'UPDATE cache_entry SET value = value + ? '
+            "WHERE key = ? AND typeof(value) = 'integer' "
+            'AND (expires IS NULL OR expires > ?) RETURNING value',
+            (delta, self._key(key, version), time.time()),
+        ).fetchone()
+        if row is not None:
+            return row[0]
+        # Ключа нет или значение не целое: как в остальных бэкендах
+        value = self.get(key, version=version)
+        if value is None:
+            raise ValueError(f"Key '{key}' not found")
+        new_value = value + delta
+        self.set(key, new_value, version=version)
+        return new_value
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entry')
+
+    def close(self, **kwargs):
+        # Django закрывает кэши после каждого запроса; соединение
+        # с файлом дешевле держать открытым
+        pass
+
+    def stats(self):
+        """Число записей и суммарный размер значений в байтах."""
+        entries, size = self._connection().execute(
+            'SELECT entries, size FROM cache_total'
+        ).fetchone()
+        return {'entries': entries, 'size': size}
+
+    def _cull(self):
+        connection = self._connection()
+        entries, size = connection.execute(
+            'SELECT entries, size FROM cache_total'
+        ).fetchone()
+        if entries <= self._max_entries and size <= self.max_size:
+            return
+        connection.execute(
+            'DELETE FROM cache_entry WHERE expires <= ?', (time.time(),)
+        )
+        keep = 1 - 1 / self._cull_frequency if self._cull_frequency else 0
+        max_entries = int(self._max_entries * keep)
+        max_size = int(self.max_size * keep)
+        while True:
+            entries, size = connection.execute(
+                'SELECT entries, size FROM cache_total'
+            ).fetchone()
+            if entries <= max_entries and size <= max_size:
+                return
+            # Сколько удалить, оцениваем по среднему размеру записи
+            count = max(
+                entries - max_entries,
+                math.ceil((size - max_size) * entries / size) if size else 0,
+                1,
+            )
+            connection.execute(
+                'DELETE FROM cache_entry WHERE key IN (SELECT key '
+                'FROM cache_entry ORDER BY accessed LIMIT ?)',
+                (count,),
+            )
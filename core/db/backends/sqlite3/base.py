@@ -0,0 +1,74 @@
+"""
+SQLite с настройками для продакшена.
+
+Кроме обычных параметров sqlite3.connect в OPTIONS принимаются:
+
+pragmas — PRAGMA, которые выполняются сразу после открытия соединения,
+    в порядке объявления. journal_mode и mmap_size сохраняются в самом
+    файле базы или действуют на всё соединение, поэтому их достаточно
+    выполнить один раз на соединение, а не на каждый запрос.
+transaction_mode — как начинать транзакции внутри atomic: DEFERRED
+    (поведение Django по умолчанию), IMMEDIATE или EXCLUSIVE. В режиме
+    WAL отложенная транзакция, которая сначала читает, а потом пишет,
+    получает «database is locked» сразу, без ожидания busy_timeout,
+    если другое соединение успело записать. IMMEDIATE берёт блокировку
+    на запись в начале транзакции и ждёт её в пределах busy_timeout.
+
+DatabaseWrapper.commits — число коммитов транзакций всеми соединениями
+процесса, для замеров.
+"""
+import re
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+_pragma_name = re.compile(r'^\w+$')
+_pragma_value = re.compile(r'^-?\w+$')
+_commits_lock = threading.Lock()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    commits = 0
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas().items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def pragmas(self):
+        pragmas = self.settings_dict['OPTIONS'].get('pragmas') or {}
+        for name, value in pragmas.items():
+            if not (_pragma_name.match(name)
+                    and _pragma_value.match(str(value))):
+                raise ImproperlyConfigured(
+                    f'Недопустимая PRAGMA в OPTIONS: {name} = {value}'
+                )
+        return pragmas
+
+    def transaction_mode(self):
+        mode = self.settings_dict['OPTIONS'].get(
+            'transaction_mode', 'DEFERRED'
+        ).upper()
+        if mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode должен быть одним из {TRANSACTION_MODES}'
+            )
+        return mode
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode()}')
+
+    def _commit(self):
+        super()._commit()
+        with _commits_lock:
+            DatabaseWrapper.commits += 1
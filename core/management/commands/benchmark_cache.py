@@ -0,0 +1,63 @@
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from core.benchmark import CacheBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает общий кэш SQLite с LocMemCache и FileBasedCache: '
+        'скорость операций и попадания между процессами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument(
+            '--size', type=int, default=20000,
+            help='размер значения в байтах, по умолчанию как у страницы',
+        )
+        parser.add_argument('--processes', type=int, default=4)
+
+    def handle(self, *args, **options):
+        # Лимиты выше числа ключей, чтобы замер не упирался в вытеснение
+        options_ = {'MAX_ENTRIES': options['keys'] * 2}
+        with tempfile.TemporaryDirectory() as directory:
+            backends = {
+                'locmem': {
+                    'BACKEND':
+                        'django.core.cache.backends.locmem.LocMemCache',
+                    'LOCATION': 'benchmark',
+                    'OPTIONS': options_,
+                },
+                'filebased': {
+                    'BACKEND':
+                        'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': f'{directory}/filebased',
+                    'OPTIONS': options_,
+                },
+                'sqlite': {
+                    'BACKEND': 'core.cache.SQLiteCache',
+                    'LOCATION': f'{directory}/cache.sqlite3',
+                    'OPTIONS': {
+                        **options_,
+                        'MAX_SIZE': options['keys'] * options['size'] * 2,
+                    },
+                },
+            }
+            results = CacheBenchmark(
+                backends, options['keys'], options['size'],
+                options['processes'],
+            ).run()
+
+        columns = (
+            'set_ops', 'get_ops', 'incr_ops', 'shared_get_ops',
+            'shared_hit_rate',
+        )
+        self.stdout.write(
+            f'{"бэкенд":<10}' + ''.join(f'{c:>16}' for c in columns)
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<10}' + ''.join(f'{result[c]:>16}' for c in columns)
+            )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core import ratelimit
+
+
+class Command(BaseCommand):
+    help = 'Показывает лимиты частоты записей и сколько раз они срабатывали'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true', help='обнулить счётчики',
+        )
+
+    def handle(self, *args, **options):
+        for scope, count in ratelimit.stats().items():
+            burst, period = ratelimit.limits()[scope]
+            self.stdout.write(
+                f'{scope}: {burst} за {period:g} с, срабатываний: {count}'
+            )
+        if options['reset']:
+            ratelimit.reset_stats()
+            self.stdout.write('Счётчики обнулены')
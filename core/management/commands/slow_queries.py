@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.queries import slow_query_log, slow_query_ms
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает самые частые формы медленных запросов '
+        'по всем процессам'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument(
+            '--reset', action='store_true', help='очистить сводку',
+        )
+
+    def handle(self, *args, **options):
+        rows = slow_query_log.top(options['top'])
+        self.stdout.write(
+            f'Запросы дольше {slow_query_ms()} мс, форм: {len(rows)}'
+        )
+        for row in rows:
+            self.stdout.write(
+                f'{row["count"]:>8} раз {row["total_ms"]:>10} мс '
+                f'{row["view"] or "-"}: {row["fingerprint"]}'
+            )
+        if options['reset']:
+            slow_query_log.reset()
+            self.stdout.write('Сводка очищена')
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import replicas
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в реплики DATABASE_REPLICAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='aliases',
+            help='реплика; по умолчанию все',
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            help='повторять каждые N секунд, имитируя репликацию',
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or replicas.replicas()
+        if not aliases:
+            raise CommandError(
+                'Реплики не настроены: задайте DJANGO_REPLICA_DB'
+            )
+        unknown = set(aliases) - set(replicas.replicas())
+        if unknown:
+            raise CommandError(f'Не реплики: {", ".join(sorted(unknown))}')
+        while True:
+            for alias in aliases:
+                started = time.perf_counter()
+                try:
+                    replicas.sync(alias)
+                except ValueError as error:
+                    raise CommandError(error)
+                self.stdout.write(
+                    f'{alias}: {time.perf_counter() - started:.2f} с'
+                )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,91 @@
+import logging
+
+from django.conf import settings
+
+from . import profiler, replicas
+from .queries import QueryRecorder, slow_query_log, view_stats
+
+logger = logging.getLogger('core.queries')
+
+
+class QueryCountMiddleware:
+    """
+    Считает запросы и время БД для каждого запроса, копит статистику по
+    имени маршрута, ведёт журнал медленных запросов и предупреждает
+    о повторяющихся формах запросов и превышении объявленного бюджета.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_REPEAT_THRESHOLD', 3)
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        match = request.resolver_match
+        url_name = match.url_name if match else None
+        view_stats.record(url_name, recorder)
+        slow_query_log.record(url_name, recorder)
+
+        for shape, count in recorder.repeated(self.threshold).items():
+            logger.warning(
+                'Повторяющийся запрос (%d раз) во вьюхе %s: %s',
+                count, url_name, shape,
+            )
+        budget = getattr(match.func, 'query_budget', None) if match else None
+        if budget is not None and len(recorder) > budget:
+            logger.warning(
+                'Вьюха %s выполнила %d запросов при бюджете %d',
+                url_name, len(recorder), budget,
+            )
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    Включает чтение с реплики для GET-запросов к вьюхам с read_replica,
+    если клиент недавно ничего не записывал, и ставит cookie липкости
+    к основной базе после запроса, который что-то записал.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replicas.begin(replica_reads=False)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = replicas.end()
+        if wrote and replicas.replicas():
+            response.set_cookie(
+                replicas.STICKY_COOKIE, '1',
+                max_age=replicas.sticky_seconds(),
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in ('GET', 'HEAD')
+            and getattr(view_func, 'read_replica', False)
+            and replicas.STICKY_COOKIE not in request.COOKIES
+        ):
+            replicas.begin(replica_reads=True)
+
+
+class ProfilerMiddleware:
+    """
+    Выполняет запрос сотрудника под профилировщиком, если он об этом
+    просит (см. core.profiler). Должен стоять после
+    AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = profiler.requested(request)
+        if mode is None or not request.user.is_staff:
+            return self.get_response(request)
+        return profiler.run(request, self.get_response, mode)
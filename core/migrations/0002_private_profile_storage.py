@@ -0,0 +1,19 @@
+# Generated by Django 2.2.28 on 2026-10-18 04:17
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_profile_capture'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profilecapture',
+            name='profile',
+            field=models.FileField(storage=core.models.PrivateStorage(), upload_to='profiles/'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.utils.functional import cached_property
+
+User = get_user_model()
+
+
+class PrivateStorage(FileSystemStorage):
+    """
+    Файлы в PRIVATE_MEDIA_ROOT, который веб-сервер не раздаёт. Ссылок на
+    них нет: например, дамп профиля показывает пути кода и данные
+    запроса, и его отдаёт сотрудникам только админка.
+    """
+
+    @cached_property
+    def base_location(self):
+        return settings.PRIVATE_MEDIA_ROOT
+
+    @cached_property
+    def base_url(self):
+        return None
+
+
+class ProfileCapture(models.Model):
+    """
+    Один запрос, выполненный под профилировщиком по просьбе сотрудника:
+    дамп cProfile в файле и разобранные для админки выжимки — самые
+    дорогие функции, выделения памяти и запросы к БД по порядку.
+    """
+    created = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='+'
+    )
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    url_name = models.CharField(max_length=200, blank=True)
+    status = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    db_time_ms = models.FloatField()
+    # marshal-дамп pstats: python -m pstats, snakeviz и т. п.
+    profile = models.FileField(
+        upload_to='profiles/', storage=PrivateStorage()
+    )
+    functions = models.TextField()
+    allocations = models.TextField(blank=True)
+    # JSON: [{"start_ms", "duration_ms", "sql"}, ...]
+    queries = models.TextField()
+
+    class Meta:
+        ordering = ['-created', '-pk']
+
+    def __str__(self):
+        return f'{self.method} {self.path}'
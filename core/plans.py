@@ -0,0 +1,78 @@
+"""
+Проверка планов запросов SQLite: каждый SELECT, выполненный внутри
+контекста PlanRecorder, прогоняется через EXPLAIN QUERY PLAN и
+считается проблемным, если читает таблицу целиком или сортирует
+результат во временном B-дереве вместо чтения индекса по порядку.
+"""
+import re
+from contextlib import ExitStack
+
+from django.db import connections
+
+_full_scan = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+_temp_sort = 'USE TEMP B-TREE'
+
+
+def explain(connection, sql, params):
+    """Строки EXPLAIN QUERY PLAN для запроса."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def problems(plan, allowed_tables=()):
+    """
+    Шаги плана с полным чтением таблицы или сортировкой во временном
+    B-дереве. Полное чтение таблиц из allowed_tables допускается:
+    это справочники из нескольких строк.
+    """
+    found = []
+    for step in plan:
+        match = _full_scan.match(step)
+        if match and match.group(1) not in allowed_tables:
+            found.append(step)
+        elif step.startswith(_temp_sort):
+            found.append(step)
+    return found
+
+
+class PlanRecorder:
+    """
+    Записывает SELECT-запросы ко всем SQLite-базам, чтобы после
+    выхода из контекста разобрать их планы методом report().
+    """
+
+    def __init__(self, allowed_tables=()):
+        self.allowed_tables = allowed_tables
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            if connection.vendor == 'sqlite':
+                self._stack.enter_context(
+                    connection.execute_wrapper(self._recorder(connection))
+                )
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def _recorder(self, connection):
+        def record(execute, sql, params, many, context):
+            if not many and sql.lstrip().upper().startswith('SELECT'):
+                self.queries.append((connection, sql, params))
+            return execute(sql, params, many, context)
+        return record
+
+    def report(self):
+        """Список (sql, проблемные шаги плана) для плохих запросов."""
+        found = []
+        for connection, sql, params in self.queries:
+            steps = problems(
+                explain(connection, sql, params), self.allowed_tables
+            )
+            if steps:
+                found.append((sql, steps))
+        return found
@@ -0,0 +1,153 @@
+"""
+Профилирование отдельного запроса по просьбе сотрудника.
+
+Запрос с параметром _profile или заголовком X-Profile от пользователя
+с is_staff выполняется под cProfile; со значением memory — ещё и под
+tracemalloc. Дамп профиля сохраняется файлом, а самые дорогие функции,
+выделения памяти и все запросы к БД со временем начала — в модели
+ProfileCapture, которую показывает админка. Номер записи приходит
+в заголовке ответа X-Profile-Capture. Хранятся последние
+PROFILER_KEEP записей.
+
+Остальные запросы проверяются только на наличие параметра и заголовка.
+cProfile видит лишь поток запроса, а tracemalloc, пока включён, считает
+выделения всех потоков процесса.
+"""
+import cProfile
+import io
+import json
+import logging
+import marshal
+import pstats
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .models import ProfileCapture
+from .queries import QueryRecorder
+
+logger = logging.getLogger('core.profiler')
+
+QUERY_PARAMETER = '_profile'
+HEADER = 'HTTP_X_PROFILE'
+
+
+def keep():
+    return getattr(settings, 'PROFILER_KEEP', 100)
+
+
+def top():
+    return getattr(settings, 'PROFILER_TOP', 40)
+
+
+def requested(request):
+    """
+    Режим профилирования, о котором просит запрос: 'cpu', 'memory'
+    или None.
+    """
+    mode = None
+    if QUERY_PARAMETER in request.META.get('QUERY_STRING', ''):
+        mode = request.GET.get(QUERY_PARAMETER)
+    if mode is None:
+        mode = request.META.get(HEADER)
+    if mode is None:
+        return None
+    return 'memory' if mode == 'memory' else 'cpu'
+
+
+class TimelineRecorder(QueryRecorder):
+    """QueryRecorder, запоминающий ещё и момент начала каждого запроса."""
+
+    def __init__(self):
+        super().__init__()
+        self.timeline = []
+        self.started = time.perf_counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return super().__call__(execute, sql, params, many, context)
+        finally:
+            if len(self.timeline) < len(self.queries):
+                self.timeline.append((start - self.started, *self.queries[-1]))
+
+
+def _functions(profiler):
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.strip_dirs().sort_stats('cumulative').print_stats(top())
+    # Дамп без strip_dirs: пути нужны, чтобы открыть его в просмотрщике
+    return output.getvalue(), marshal.dumps(pstats.Stats(profiler).stats)
+
+
+def _allocations(snapshot):
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    return '\n'.join(
+        str(statistic)
+        for statistic in snapshot.statistics('lineno')[:top()]
+    )
+
+
+def run(request, get_response, mode):
+    """Выполняет запрос под профилировщиком и сохраняет ProfileCapture."""
+    profiler = cProfile.Profile()
+    tracing = mode == 'memory' and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        with TimelineRecorder() as recorder:
+            profiler.enable()
+            try:
+                response = get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+        snapshot = tracemalloc.take_snapshot() if mode == 'memory' else None
+    finally:
+        if tracing:
+            tracemalloc.stop()
+
+    functions, dump = _functions(profiler)
+    match = request.resolver_match
+    capture = ProfileCapture(
+        user=request.user,
+        method=request.method,
+        path=request.get_full_path()[:2000],
+        url_name=(match.url_name or '') if match else '',
+        status=response.status_code,
+        duration_ms=duration * 1000,
+        query_count=len(recorder),
+        db_time_ms=recorder.duration * 1000,
+        functions=functions,
+        allocations=_allocations(snapshot) if snapshot else '',
+        queries=json.dumps([
+            {
+                'start_ms': round(start * 1000, 3),
+                'duration_ms': round(query_duration * 1000, 3),
+                'sql': sql,
+            }
+            for start, sql, query_duration in recorder.timeline
+        ], ensure_ascii=False),
+    )
+    capture.profile.save(
+        f'{time.strftime("%Y%m%d-%H%M%S")}.prof', ContentFile(dump),
+        save=False,
+    )
+    capture.save()
+    _prune()
+    logger.info('Профиль запроса %s сохранён: %s', capture.path, capture.pk)
+    response['X-Profile-Capture'] = str(capture.pk)
+    return response
+
+
+def _prune():
+    old = ProfileCapture.objects.order_by('-created', '-pk')[keep():]
+    for capture in old:
+        capture.profile.delete(save=False)
+        capture.delete()
@@ -0,0 +1,237 @@
+"""
+Учёт SQL-запросов: сколько запросов и времени БД уходит на каждую вьюху
+и какие запросы повторяются с разными параметрами (признак N+1).
+
+Журнал медленных запросов пишет в логгер core.slow_queries запросы
+дольше SLOW_QUERY_MS и случайную долю SLOW_QUERY_SAMPLE_RATE остальных,
+одной строкой key=value с формой запроса вместо параметров и именем
+маршрута. Медленные запросы вдобавок суммируются по формам в общем
+кэше, так что команда slow_queries показывает самые частые из них по
+всем процессам.
+"""
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+slow_logger = logging.getLogger('core.slow_queries')
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_spaces = re.compile(r'\s+')
+_transaction_control = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+def fingerprint(sql):
+    """
+    Форма запроса без параметров: литералы заменяются на ?, списки IN
+    любой длины сворачиваются, пробелы нормализуются.
+    """
+    sql = _literals.sub('?', sql)
+    sql = _in_lists.sub('IN (...)', sql)
+    return _spaces.sub(' ', sql).strip()
+
+
+def query_budget(limit):
+    """Объявляет максимальное число запросов для вьюхи."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+class QueryRecorder:
+    """
+    Контекстный менеджер, записывающий все запросы ко всем базам
+    через connection.execute_wrapper. Работает и при DEBUG = False.
+    Управление транзакциями не считается: в тестах оно превращается
+    в SAVEPOINT и исказило бы бюджеты.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.startswith(_transaction_control):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    def __len__(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for sql, duration in self.queries)
+
+    def repeated(self, threshold):
+        """Формы запросов, выполненные не меньше threshold раз."""
+        shapes = Counter(fingerprint(sql) for sql, duration in self.queries)
+        return {
+            shape: count for shape, count in shapes.items()
+            if count >= threshold
+        }
+
+
+class ViewStats:
+    """Накопленная статистика запросов по именам маршрутов."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, url_name, recorder):
+        with self._lock:
+            view = self._views.setdefault(
+                url_name, {'requests': 0, 'queries': 0, 'db_time': 0.0}
+            )
+            view['requests'] += 1
+            view['queries'] += len(recorder)
+            view['db_time'] += recorder.duration
+
+    def summary(self):
+        with self._lock:
+            return {name: dict(view) for name, view in self._views.items()}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+view_stats = ViewStats()
+
+
+def slow_query_ms():
+    return getattr(settings, 'SLOW_QUERY_MS', 100)
+
+
+def slow_query_sample_rate():
+    return getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 0.001)
+
+
+def slow_query_max_fingerprints():
+    return getattr(settings, 'SLOW_QUERY_MAX_FINGERPRINTS', 1000)
+
+
+class SlowQueryLog:
+    """
+    Медленные запросы по формам в общем кэше. Для формы хранятся её
+    текст, число запросов и суммарное время в мс — отдельными ключами,
+    чтобы счётчики росли атомарным incr. Номера форм лежат в слотах
+    1..N, N — в ключе INDEX_KEY; новых форм больше
+    SLOW_QUERY_MAX_FINGERPRINTS не заводится.
+    """
+
+    INDEX_KEY = 'slow_queries:index'
+
+    @staticmethod
+    def _key(kind, name):
+        return f'slow_queries:{kind}:{name}'
+
+    @staticmethod
+    def _incr(key, delta):
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            # Гонка двух процессов здесь теряет одно значение, не больше
+            cache.set(key, delta, None)
+            return delta
+
+    def record(self, url_name, recorder):
+        """Пишет в журнал медленные и выборку быстрых запросов."""
+        threshold = slow_query_ms() / 1000
+        rate = slow_query_sample_rate()
+        for sql, duration in recorder.queries:
+            slow = duration >= threshold
+            if not slow and (not rate or random.random() >= rate):
+                continue
+            shape = fingerprint(sql)
+            slow_logger.info(
+                'slow_query=%d duration_ms=%.1f view=%s fingerprint="%s"',
+                slow, duration * 1000, url_name, shape,
+                extra={
+                    'slow_query': slow, 'duration_ms': duration * 1000,
+                    'view': url_name, 'fingerprint': shape,
+                },
+            )
+            if slow:
+                self.add(shape, duration, url_name)
+
+    def add(self, shape, duration, url_name=None):
+        digest = hashlib.md5(shape.encode()).hexdigest()
+        if cache.get(self._key('sql', digest)) is None:
+            if (cache.get(self.INDEX_KEY) or 0) >= (
+                slow_query_max_fingerprints()
+            ):
+                return
+            if cache.add(self._key('sql', digest), (shape, url_name), None):
+                slot = self._incr(self.INDEX_KEY, 1)
+                cache.set(self._key('slot', slot), digest, None)
+        self._incr(self._key('count', digest), 1)
+        self._incr(self._key('ms', digest), max(round(duration * 1000), 1))
+
+    def _digests(self):
+        slots = cache.get(self.INDEX_KEY) or 0
+        return list(cache.get_many([
+            self._key('slot', slot) for slot in range(1, slots + 1)
+        ]).values())
+
+    def top(self, limit=20):
+        """
+        Самые частые формы медленных запросов: словари с ключами
+        fingerprint, view (где встретилась впервые), count и total_ms.
+        """
+        digests = self._digests()
+        values = cache.get_many([
+            self._key(kind, digest)
+            for digest in digests for kind in ('sql', 'count', 'ms')
+        ])
+        rows = []
+        for digest in digests:
+            if self._key('sql', digest) not in values:
+                continue
+            shape, url_name = values[self._key('sql', digest)]
+            rows.append({
+                'fingerprint': shape,
+                'view': url_name,
+                'count': values.get(self._key('count', digest), 0),
+                'total_ms': values.get(self._key('ms', digest), 0),
+            })
+        rows.sort(key=lambda row: (-row['count'], -row['total_ms']))
+        return rows[:limit]
+
+    def reset(self):
+        digests = self._digests()
+        slots = cache.get(self.INDEX_KEY) or 0
+        cache.delete_many(
+            [self.INDEX_KEY]
+            + [self._key('slot', slot) for slot in range(1, slots + 1)]
+            + [
+                self._key(kind, digest)
+                for digest in digests for kind in ('sql', 'count', 'ms')
+            ]
+        )
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,109 @@
+"""
+Ограничение частоты записей: token bucket в общем кэше.
+
+Лимит области задаётся в RATE_LIMITS парой (burst, period): клиент может
+сделать подряд burst запросов, а дальше ведро пополняется на один жетон
+каждые period / burst секунд. Клиент — пользователь или, для анонимов,
+IP-адрес. Сверх лимита вьюха не вызывается, а клиент получает ответ 429
+с заголовком Retry-After.
+
+Состояние ведра — одно целое число в кэше: момент в миллисекундах,
+когда ведро снова станет полным (GCRA). Проверка — один атомарный incr,
+поэтому параллельные запросы не могут взять больше жетонов, чем есть.
+Число срабатываний по каждой области копится в кэше, его показывает
+команда rate_limits.
+"""
+import logging
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+logger = logging.getLogger('core.ratelimit')
+
+
+def limits():
+    return getattr(settings, 'RATE_LIMITS', {})
+
+
+def _bucket_key(scope, identity):
+    return f'ratelimit:{scope}:{identity}'
+
+
+def _limited_key(scope):
+    return f'ratelimit_limited:{scope}'
+
+
+def identity(request):
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+
+def check(scope, identity, now=None):
+    """
+    Берёт жетон из ведра клиента. Возвращает 0, если запрос разрешён,
+    иначе через сколько секунд появится следующий жетон.
+    """
+    if scope not in limits():
+        return 0
+    burst, period = limits()[scope]
+    interval = max(int(period * 1000 / burst), 1)
+    now = int((time.time() if now is None else now) * 1000)
+    key = _bucket_key(scope, identity)
+    # Ключ живёт два периода: за это время ведро заведомо наполняется
+    timeout = math.ceil(period * 2)
+    try:
+        full_at = cache.incr(key, interval)
+    except ValueError:
+        full_at = None
+    if full_at is None or full_at - interval < now:
+        # Ведро было полным: отсчёт заново от текущего момента
+        cache.set(key, now + interval, timeout)
+        return 0
+    if full_at - now <= burst * interval:
+        return 0
+    cache.decr(key, interval)
+    cache.touch(key, timeout)
+    try:
+        cache.incr(_limited_key(scope))
+    except ValueError:
+        cache.set(_limited_key(scope), 1, None)
+    logger.debug('Лимит %s превышен: %s', scope, identity)
+    return (full_at - now - burst * interval) / 1000
+
+
+def stats():
+    """Сколько раз срабатывал лимит каждой настроенной области."""
+    counts = cache.get_many([_limited_key(scope) for scope in limits()])
+    return {
+        scope: counts.get(_limited_key(scope), 0) for scope in limits()
+    }
+
+
+def reset_stats():
+    cache.delete_many([_limited_key(scope) for scope in limits()])
+
+
+def rate_limit(scope, methods=None):
+    """
+    Ограничивает частоту запросов к вьюхе лимитом области scope;
+    methods — какие методы считать, по умолчанию все.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                retry_after = check(scope, identity(request))
+                if retry_after:
+                    response = render(
+                        request, 'misc/429.html', status=429
+                    )
+                    response['Retry-After'] = math.ceil(retry_after)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
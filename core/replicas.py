@@ -0,0 +1,106 @@
+"""
+Чтение лент с реплик базы.
+
+Вьюхи, помеченные декоратором read_replica, на GET-запросах читают с
+одной из реплик DATABASE_REPLICAS; всё остальное, включая любые записи,
+идёт в основную базу. Реплика отстаёт от основной базы, поэтому после
+записи ReplicaMiddleware ставит клиенту cookie, и следующие
+REPLICA_STICKY_SECONDS секунд он читает только из основной базы и видит
+свои посты, комментарии и подписки.
+
+Локально репликой служит второй файл SQLite: его путь задаётся
+переменной окружения DJANGO_REPLICA_DB, а копия основной базы
+снимается командой sync_replica.
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'read_primary'
+
+# Сессии читаются из основной базы: только что созданная сессия
+# ещё не доехала до реплики, и пользователь оказался бы разлогинен
+PRIMARY_ONLY_APPS = {'sessions'}
+
+_state = threading.local()
+
+
+def read_replica(view):
+    """Разрешает вьюхе читать с реплики на GET-запросах."""
+    view.read_replica = True
+    return view
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+
+def reading_from_replica():
+    """Читает ли текущий запрос с реплики."""
+    return (
+        getattr(_state, 'replica_reads', False)
+        and not getattr(_state, 'wrote', False)
+        and bool(replicas())
+        and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+    )
+
+
+def begin(replica_reads):
+    _state.replica_reads = replica_reads
+    _state.wrote = False
+
+
+def end():
+    """Завершает запрос; возвращает, была ли в нём запись."""
+    wrote = getattr(_state, 'wrote', False)
+    _state.replica_reads = False
+    _state.wrote = False
+    return wrote
+
+
+class ReplicaRouter:
+    """
+    Чтения вьюх с read_replica — на случайную реплику, пока в запросе
+    не было записи и не открыта транзакция; записи и миграции — только
+    в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        if reading_from_replica():
+            return random.choice(replicas())
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в основной базе
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas()
+
+
+def sync(alias, source=DEFAULT_DB_ALIAS):
+    """
+    Копирует основную базу SQLite в реплику целиком через backup API.
+    Читатели реплики видят либо старую, либо новую копию, но не смесь.
+    """
+    source_connection = connections[source]
+    target_connection = connections[alias]
+    for connection in (source_connection, target_connection):
+        if connection.vendor != 'sqlite':
+            raise ValueError(
+                f'sync поддерживает только SQLite, а не {connection.vendor}'
+            )
+        connection.ensure_connection()
+    source_connection.connection.backup(target_connection.connection)
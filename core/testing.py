@@ -0,0 +1,93 @@
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.urls import resolve
+
+from .plans import PlanRecorder
+from .queries import QueryRecorder
+
+
+class QueryBudgetMixin:
+    """Проверки числа запросов для TestCase."""
+
+    @contextmanager
+    def assertMaxQueries(self, limit):
+        with QueryRecorder() as recorder:
+            yield recorder
+        if len(recorder) > limit:
+            self.fail(self._budget_message(len(recorder), limit, recorder))
+
+    def assertWithinQueryBudget(self, client, url, method='get', **kwargs):
+        """
+        Выполняет запрос и сверяет число запросов к БД с бюджетом,
+        объявленным у вьюхи декоратором query_budget.
+        """
+        path = url.split('?', 1)[0]
+        budget = getattr(resolve(path).func, 'query_budget', None)
+        if budget is None:
+            self.fail(f'У вьюхи для {path} не объявлен query_budget')
+        with QueryRecorder() as recorder:
+            response = getattr(client, method)(url, **kwargs)
+        if len(recorder) > budget:
+            self.fail(self._budget_message(len(recorder), budget, recorder))
+        return response
+
+    @staticmethod
+    def _budget_message(count, limit, recorder):
+        queries = '\n'.join(
+            f'{number}. {sql}'
+            for number, (sql, duration) in enumerate(recorder.queries, 1)
+        )
+        return f'{count} запросов при бюджете {limit}:\n{queries}'
+
+
+class QueryPlanMixin:
+    """Проверка планов запросов вьюхи для TestCase (только SQLite)."""
+
+    def assertIndexedPlans(self, client, url, allowed_tables=()):
+        """
+        Выполняет GET-запрос и проверяет, что ни один SELECT не читает
+        таблицу целиком и не сортирует во временном B-дереве.
+        """
+        with PlanRecorder(allowed_tables) as recorder:
+            response = client.get(url)
+        found = recorder.report()
+        if found:
+            self.fail(f'Неиндексные планы для {url}:\n' + '\n'.join(
+                f'{steps}: {sql}' for sql, steps in found
+            ))
+        return response
+
+
+@contextmanager
+def isolated_cache():
+    """
+    Кэш SQLite во временном каталоге вместо общего файла: тесты не должны
+    ни читать страницы разработческого сервера, ни оставлять ему свои.
+    """
+    directory = tempfile.mkdtemp(prefix='cache-')
+    caches = {
+        alias: {**params, 'LOCATION': f'{directory}/{alias}.sqlite3'}
+        if params['BACKEND'] == 'core.cache.SQLiteCache' else params
+        for alias, params in settings.CACHES.items()
+    }
+    try:
+        with override_settings(CACHES=caches):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache = isolated_cache()
+        self._cache.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,472 @@
+import json
+import marshal
+import os
+import sqlite3
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test import override_settings
+from django.urls import reverse
+
+from core.benchmark import compare, percentile
+from core.cache import SQLiteCache
+from core.db.backends.sqlite3.base import DatabaseWrapper
+from core.middleware import ReplicaMiddleware
+from core.models import ProfileCapture
+from core.replicas import STICKY_COOKIE, ReplicaRouter, read_replica
+from core.plans import problems
+from core.ratelimit import check, rate_limit
+from core.queries import (
+    QueryRecorder, fingerprint, slow_query_log, view_stats,
+)
+from posts.models import Post, User
+
+
+class QueryInstrumentation(TestCase):
+    def setUp(self):
+        cache.clear()
+        view_stats.reset()
+        self.user = User.objects.create_user(username='user')
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE a = 10 AND b = 'x''y'"),
+            'SELECT * FROM t WHERE a = ? AND b = ?',
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s)'),
+        )
+
+    def test_recorder_finds_repeated_queries(self):
+        for number in range(3):
+            Post.objects.create(text=str(number), author=self.user)
+        with QueryRecorder() as recorder:
+            for post in Post.objects.all():
+                post.author.username
+        self.assertEqual(len(recorder), 4)
+        self.assertEqual(list(recorder.repeated(3).values()), [3])
+
+    def test_middleware_collects_stats(self):
+        self.client.get(reverse('index'))
+        stats = view_stats.summary()['index']
+        self.assertEqual(stats['requests'], 1)
+        self.assertGreater(stats['queries'], 0)
+
+    def test_middleware_reports_n_plus_one(self):
+        with self.settings(QUERY_REPEAT_THRESHOLD=1):
+            with self.assertLogs('core.queries', level='WARNING'):
+                self.client.get(reverse('index'))
+
+    def test_slow_query_log(self):
+        slow_query_log.reset()
+        with self.settings(SLOW_QUERY_MS=10 ** 6, SLOW_QUERY_SAMPLE_RATE=0):
+            with self.assertNoLogs('core.slow_queries'):
+                self.client.get(reverse('index'))
+        with self.settings(SLOW_QUERY_MS=10 ** 6, SLOW_QUERY_SAMPLE_RATE=1):
+            with self.assertLogs('core.slow_queries') as logs:
+                cache.clear()
+                self.client.get(reverse('index'))
+        self.assertTrue(all(
+            record.slow_query is False and record.view == 'index'
+            for record in logs.records
+        ))
+        self.assertEqual(slow_query_log.top(), [])
+
+        with self.settings(SLOW_QUERY_MS=0):
+            with self.assertLogs('core.slow_queries') as logs:
+                cache.clear()
+                self.client.get(reverse('index'))
+                self.client.get(reverse('trending'))
+        self.assertIn('slow_query=1', logs.output[0])
+        top = slow_query_log.top(1)[0]
+        self.assertIn(top['view'], ('index', 'trending'))
+        self.assertNotRegex(top['fingerprint'], r'\b\d+\b')
+        out = StringIO()
+        call_command('slow_queries', '--reset', stdout=out)
+        self.assertIn(top['fingerprint'], out.getvalue())
+        self.assertEqual(slow_query_log.top(), [])
+
+
+class Benchmarks(TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_compare_with_baseline(self):
+        baseline = {
+            'index': {'p95_ms': 10.0, 'queries': 3, 'status': [200]},
+        }
+        self.assertEqual(compare(baseline, baseline), [])
+        slower = {
+            'index': {'p95_ms': 13.0, 'queries': 4, 'status': [500]},
+            'new': {'p95_ms': 1.0, 'queries': 1, 'status': [200]},
+        }
+        self.assertEqual(len(compare(slower, baseline)), 3)
+        self.assertEqual(len(compare(slower, baseline, threshold=0.5)), 2)
+
+
+class QueryPlanChecks(TestCase):
+    def test_problems(self):
+        plan = [
+            'SEARCH posts_post USING INDEX posts_post_author (author_id=?)',
+            'SCAN posts_post USING INDEX posts_post_pub_date',
+            'SCAN posts_post_fts VIRTUAL TABLE INDEX 0:M2',
+        ]
+        self.assertEqual(problems(plan), [])
+        plan = ['SCAN posts_post', 'USE TEMP B-TREE FOR ORDER BY']
+        self.assertEqual(problems(plan), plan)
+        self.assertEqual(
+            problems(['SCAN TABLE django_site'], ('django_site',)), []
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir(), PROFILER_KEEP=2)
+class Profiler(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user')
+        self.staff = User.objects.create_superuser(
+            'staff', 'staff@example.com', 'password'
+        )
+        Post.objects.create(text='Пост', author=self.user)
+        self.url = reverse('profile', kwargs={'username': 'user'})
+
+    def tearDown(self):
+        for capture in ProfileCapture.objects.all():
+            capture.profile.delete(save=False)
+
+    def test_only_staff_can_profile(self):
+        response = self.client.get(self.url, {'_profile': '1'})
+        self.assertNotIn('X-Profile-Capture', response)
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Capture', response)
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url)
+        self.assertNotIn('X-Profile-Capture', response)
+        self.assertFalse(ProfileCapture.objects.exists())
+
+    def test_capture(self):
+        self.client.force_login(self.staff)
+        with self.assertLogs('core.profiler'):
+            response = self.client.get(self.url, {'_profile': 'memory'})
+        capture = ProfileCapture.objects.get(
+            pk=response['X-Profile-Capture']
+        )
+        self.assertEqual(capture.url_name, 'profile')
+        self.assertEqual(capture.user, self.staff)
+        self.assertIn('views.py', capture.functions)
+        self.assertTrue(capture.allocations)
+        queries = json.loads(capture.queries)
+        self.assertEqual(len(queries), capture.query_count)
+        self.assertGreater(len(queries), 0)
+        self.assertEqual(
+            queries, sorted(queries, key=lambda query: query['start_ms'])
+        )
+        with capture.profile.open('rb') as dump:
+            self.assertTrue(marshal.load(dump))
+
+        response = self.client.get(
+            reverse('admin:core_profilecapture_change', args=[capture.pk])
+        )
+        self.assertContains(response, 'views.py')
+        self.assertContains(response, 'posts_post')
+
+    def test_profile_download(self):
+        self.client.force_login(self.staff)
+        with self.assertLogs('core.profiler'):
+            response = self.client.get(self.url, {'_profile': '1'})
+        capture = ProfileCapture.objects.get(
+            pk=response['X-Profile-Capture']
+        )
+        # Дамп не попадает в раздаваемый MEDIA_ROOT
+        self.assertFalse(capture.profile.path.startswith(
+            os.path.join(settings.MEDIA_ROOT, '')
+        ))
+        with self.assertRaises(ValueError):
+            capture.profile.url
+        url = reverse('admin:core_profilecapture_profile', args=[capture.pk])
+        response = self.client.get(
+            reverse('admin:core_profilecapture_change', args=[capture.pk])
+        )
+        self.assertContains(response, url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(marshal.loads(b''.join(response.streaming_content)))
+        response.close()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_keeps_latest(self):
+        self.client.force_login(self.staff)
+        with self.assertLogs('core.profiler'):
+            for _ in range(3):
+                response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertEqual(
+            list(ProfileCapture.objects.values_list('pk', flat=True))[0],
+            int(response['X-Profile-Capture']),
+        )
+        self.assertEqual(ProfileCapture.objects.count(), 2)
+        self.assertEqual(ProfileCapture.objects.get(
+            pk=response['X-Profile-Capture']
+        ).allocations, '')
+        response = self.client.get(
+            reverse('admin:core_profilecapture_changelist')
+        )
+        self.assertContains(response, self.url)
+
+
+class SQLiteBackend(SimpleTestCase):
+    def connect(self, path, **options):
+        return DatabaseWrapper({
+            'NAME': path, 'ENGINE': 'core.db.backends.sqlite3',
+            'OPTIONS': options, 'CONN_MAX_AGE': 0, 'AUTOCOMMIT': True,
+            'ATOMIC_REQUESTS': False, 'TIME_ZONE': None,
+            'USER': '', 'PASSWORD': '', 'HOST': '', 'PORT': '', 'TEST': {},
+        }, alias='pragmas')
+
+    def test_pragmas_applied_on_connect(self):
+        with tempfile.TemporaryDirectory() as directory:
+            connection = self.connect(
+                os.path.join(directory, 'db.sqlite3'),
+                pragmas={
+                    'busy_timeout': 1234, 'journal_mode': 'wal',
+                    'synchronous': 'normal', 'cache_size': -2048,
+                },
+            )
+            with connection.cursor() as cursor:
+                for pragma, expected in (
+                    ('journal_mode', 'wal'), ('synchronous', 1),
+                    ('busy_timeout', 1234), ('cache_size', -2048),
+                ):
+                    cursor.execute(f'PRAGMA {pragma}')
+                    self.assertEqual(cursor.fetchone()[0], expected)
+            connection.close()
+
+    def test_immediate_transactions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'db.sqlite3')
+            connection = self.connect(
+                path, pragmas={'journal_mode': 'wal'},
+                transaction_mode='immediate',
+            )
+            connection.ensure_connection()
+            other = sqlite3.connect(path, timeout=0)
+            # Так atomic начинает транзакцию: блокировка на запись
+            # берётся сразу, до первого запроса
+            connection._start_transaction_under_autocommit()
+            with self.assertRaisesMessage(
+                sqlite3.OperationalError, 'database is locked'
+            ):
+                other.execute('BEGIN IMMEDIATE')
+            connection.connection.rollback()
+            other.execute('BEGIN IMMEDIATE')
+            other.rollback()
+            other.close()
+            connection.close()
+
+    def test_invalid_options(self):
+        connection = self.connect(':memory:', pragmas={'journal_mode': 'x;y'})
+        with self.assertRaises(ImproperlyConfigured):
+            connection.ensure_connection()
+        connection = self.connect(':memory:', transaction_mode='later')
+        with self.assertRaises(ImproperlyConfigured):
+            connection.transaction_mode()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouting(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.databases_seen = []
+
+    def view(self, write=False):
+        def feed(request):
+            if write:
+                self.router.db_for_write(Post)
+            self.databases_seen.append(self.router.db_for_read(Post))
+            self.databases_seen.append(self.router.db_for_read(Session))
+            return HttpResponse()
+        return feed
+
+    def request(self, request, view):
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+        middleware = ReplicaMiddleware(get_response)
+        self.databases_seen = []
+        return middleware(request)
+
+    def test_feed_reads_go_to_replica(self):
+        response = self.request(
+            self.factory.get('/'), read_replica(self.view())
+        )
+        self.assertEqual(self.databases_seen, ['replica', 'default'])
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        # Вне запроса и без пометки read_replica — основная база
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.request(self.factory.get('/'), self.view())
+        self.assertEqual(self.databases_seen, ['default', 'default'])
+
+    def test_write_makes_client_sticky(self):
+        response = self.request(
+            self.factory.get('/'), read_replica(self.view(write=True))
+        )
+        # После записи в том же запросе читаем из основной базы
+        self.assertEqual(self.databases_seen, ['default', 'default'])
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], 10)
+
+        request = self.factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = '1'
+        self.request(request, read_replica(self.view()))
+        self.assertEqual(self.databases_seen, ['default', 'default'])
+
+    def test_post_requests_use_primary(self):
+        self.request(self.factory.post('/'), read_replica(self.view()))
+        self.assertEqual(self.databases_seen, ['default', 'default'])
+
+    def test_migrations_skip_replicas(self):
+        self.assertTrue(self.router.allow_migrate('default', 'posts'))
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_sync_without_replicas(self):
+        with self.assertRaises(CommandError):
+            call_command('sync_replica', stdout=StringIO())
+
+
+@override_settings(RATE_LIMITS={'write': (3, 3)})
+class RateLimits(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def request(self, method='post', address='10.0.0.1'):
+        request = getattr(self.factory, method)('/', REMOTE_ADDR=address)
+        request.user = AnonymousUser()
+        return request
+
+    def test_token_bucket(self):
+        now = 1000.0
+        for _ in range(3):
+            self.assertEqual(check('write', 'client', now), 0)
+        self.assertAlmostEqual(check('write', 'client', now), 1.0)
+        self.assertEqual(check('write', 'other', now), 0)
+        self.assertEqual(check('unlimited', 'client', now), 0)
+        # Жетон в секунду: через секунду можно ровно один запрос
+        self.assertEqual(check('write', 'client', now + 1), 0)
+        self.assertGreater(check('write', 'client', now + 1), 0)
+        # Полное ведро после простоя, а не накопленный долг
+        for _ in range(3):
+            self.assertEqual(check('write', 'client', now + 100), 0)
+        self.assertGreater(check('write', 'client', now + 100), 0)
+
+    def test_view_returns_429(self):
+        view = rate_limit('write', methods=('POST',))(
+            lambda request: HttpResponse()
+        )
+        for _ in range(3):
+            self.assertEqual(view(self.request()).status_code, 200)
+        response = view(self.request())
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(response['Retry-After'], ('1', '2'))
+        self.assertEqual(view(self.request('get')).status_code, 200)
+        self.assertEqual(
+            view(self.request(address='10.0.0.2')).status_code, 200
+        )
+        out = StringIO()
+        call_command('rate_limits', '--reset', stdout=out)
+        self.assertIn('write: 3 за 3 с, срабатываний: 1', out.getvalue())
+        out = StringIO()
+        call_command('rate_limits', stdout=out)
+        self.assertIn('срабатываний: 0', out.getvalue())
+
+
+class SharedCache(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+
+    def cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': {
+            'ACCESS_RESOLUTION': 0, **options,
+        }})
+
+    def test_operations(self):
+        cache = self.cache()
+        cache.set('page', {'html': 'текст'})
+        self.assertEqual(cache.get('page'), {'html': 'текст'})
+        self.assertFalse(cache.add('page', 'другое'))
+        self.assertTrue(cache.add('new', 1))
+        self.assertEqual(cache.incr('new', 2), 3)
+        self.assertEqual(
+            cache.get_many(['page', 'new', 'missing']),
+            {'page': {'html': 'текст'}, 'new': 3},
+        )
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+        cache.set('expired', 1, timeout=0)
+        self.assertIsNone(cache.get('expired'))
+        self.assertTrue(cache.add('expired', 2))
+        self.assertTrue(cache.delete('page'))
+        self.assertFalse(cache.has_key('page'))
+        cache.clear()
+        self.assertEqual(cache.stats(), {'entries': 0, 'size': 0})
+
+    def test_shared_between_instances(self):
+        # Отдельные экземпляры — как разные процессы с одним файлом
+        first, second = self.cache(), self.cache()
+        first.set('generation', 1)
+        self.assertEqual(second.incr('generation'), 2)
+        self.assertEqual(first.get('generation'), 2)
+
+    def test_lru_eviction(self):
+        cache = self.cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        for number in range(10):
+            cache.set(f'key{number}', number)
+        # Прочитанный ключ становится самым свежим
+        cache.get('key0')
+        cache.set('key10', 10)
+        stats = cache.stats()
+        self.assertEqual(stats['entries'], 5)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertEqual(cache.get('key10'), 10)
+        self.assertIsNone(cache.get('key1'))
+
+    def test_size_cap(self):
+        cache = self.cache(MAX_SIZE=10000)
+        for number in range(50):
+            cache.set(f'key{number}', b'x' * 1000)
+        self.assertLessEqual(cache.stats()['size'], 10000)
+        self.assertIsNotNone(cache.get('key49'))
+        self.assertIsNone(cache.get('key0'))
+
+    def test_benchmark_cache(self):
+        output = StringIO()
+        call_command(
+            'benchmark_cache', '--keys', '20', '--size', '100',
+            '--processes', '2', stdout=output,
+        )
+        rows = {
+            line.split()[0]: line.split()[1:]
+            for line in output.getvalue().splitlines()[1:]
+        }
+        self.assertEqual(rows['locmem'][-1], '0.5')
+        self.assertEqual(rows['sqlite'][-1], '1.0')
+        self.assertEqual(rows['filebased'][-1], '1.0')
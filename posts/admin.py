@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Post, Group
 
 
@@ -14,6 +15,14 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идёт через полнотекстовый индекс, а не LIKE
+        if not search_term or not search.is_supported():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return search.filter_matching(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     """
@@ -0,0 +1,141 @@
+"""
+Сценарии замера вьюх для команды benchmark_views. Объекты берутся
+из текущей базы, обычно собранной командой generate_dataset: самый
+плодовитый автор, самая большая группа, самый обсуждаемый пост.
+
+load_scenarios — смесь чтения и записи для benchmark_concurrency,
+write_scenarios — только комментарии и подписки для benchmark_write_queue.
+"""
+from django.contrib.flatpages.models import FlatPage
+from django.db.models import Count
+from django.urls import reverse
+
+from core.benchmark import Scenario
+
+from .models import Group, Post, User
+
+
+def scenarios():
+    author = User.objects.order_by('-stats__posts_count').first()
+    reader = User.objects.order_by('-stats__following_count').first()
+    group = Group.objects.annotate(
+        total=Count('posts')
+    ).order_by('-total').first()
+    post = Post.objects.select_related('author').order_by(
+        '-comment_count'
+    ).first()
+    if None in (author, reader, group, post):
+        return None
+    post_kwargs = {'username': post.author.username, 'post_id': post.id}
+
+    result = [
+        Scenario('index', reverse('index')),
+        Scenario('group_posts', reverse('group_posts', args=[group.slug])),
+        Scenario('profile', reverse('profile', args=[author.username])),
+        Scenario('post', reverse('post', kwargs=post_kwargs)),
+        Scenario(
+            'search', reverse('search'), data={'q': post.text.split()[0]}
+        ),
+        Scenario('follow_index', reverse('follow_index'), user=reader),
+        Scenario('new_post', reverse('new_post'), user=reader),
+        Scenario(
+            'new_post POST', reverse('new_post'), method='post',
+            data={'text': 'Новый пост', 'group': group.id}, user=reader,
+        ),
+        Scenario(
+            'post_edit', reverse('post_edit', kwargs=post_kwargs),
+            user=post.author,
+        ),
+        Scenario(
+            'add_comment POST', reverse('add_comment', kwargs=post_kwargs),
+            method='post', data={'text': 'Комментарий'}, user=reader,
+        ),
+        Scenario('about', reverse('about')),
+        Scenario('terms', reverse('terms')),
+    ]
+    flatpage = FlatPage.objects.exclude(
+        url__in=[reverse('about'), reverse('terms')]
+    ).first()
+    if flatpage is not None:
+        result.append(Scenario('flatpage', '/about' + flatpage.url))
+    return result
+
+
+def load_scenarios(writers=4):
+    """
+    Чтения лент вперемешку с записями: новый пост, комментарий, подписка
+    и отписка. Пишут несколько самых активных читателей, каждый от
+    своего имени, поэтому записи разных потоков конкурируют за базу.
+    """
+    author = User.objects.order_by('-stats__posts_count').first()
+    group = Group.objects.order_by('pk').first()
+    post = Post.objects.select_related('author').order_by(
+        '-pub_date', '-id'
+    ).first()
+    if None in (author, group, post):
+        return None
+    users = list(User.objects.exclude(pk=author.pk).order_by(
+        '-stats__following_count', 'pk'
+    )[:writers])
+    if not users:
+        return None
+    post_kwargs = {'username': post.author.username, 'post_id': post.id}
+
+    result = []
+    for user in users:
+        result += [
+            Scenario('index', reverse('index')),
+            Scenario('follow_index', reverse('follow_index'), user=user),
+            Scenario(
+                'new_post POST', reverse('new_post'), method='post',
+                data={'text': 'Новый пост', 'group': group.id}, user=user,
+            ),
+            Scenario('group_posts', reverse('group_posts', args=[group.slug])),
+            Scenario(
+                'add_comment POST',
+                reverse('add_comment', kwargs=post_kwargs),
+                method='post', data={'text': 'Комментарий'}, user=user,
+            ),
+            Scenario('profile', reverse('profile', args=[author.username])),
+            Scenario(
+                'profile_follow',
+                reverse('profile_follow', args=[author.username]), user=user,
+            ),
+            Scenario('post', reverse('post', kwargs=post_kwargs)),
+            Scenario(
+                'profile_unfollow',
+                reverse('profile_unfollow', args=[author.username]), user=user,
+            ),
+        ]
+    return result
+
+
+def write_scenarios(writers=8, authors=50):
+    """
+    Каждый из writers пользователей по очереди комментирует свежий пост
+    и подписывается на следующего из authors авторов.
+    """
+    post = Post.objects.select_related('author').order_by(
+        '-pub_date', '-id'
+    ).first()
+    if post is None:
+        return None
+    users = list(User.objects.order_by('pk')[:writers])
+    targets = list(User.objects.order_by('-pk')[:authors])
+    post_kwargs = {'username': post.author.username, 'post_id': post.id}
+
+    result = []
+    for user in users:
+        for author in targets:
+            result.append(Scenario(
+                'add_comment POST',
+                reverse('add_comment', kwargs=post_kwargs),
+                method='post', data={'text': 'Комментарий'}, user=user,
+            ))
+            if author != user:
+                result.append(Scenario(
+                    'profile_follow',
+                    reverse('profile_follow', args=[author.username]),
+                    user=user,
+                ))
+    return result
@@ -0,0 +1,100 @@
+"""
+Массовая запись строк в обход моделей.
+
+Для миллионов строк bulk_create тратит большую часть времени на создание
+экземпляров моделей и сборку INSERT для каждой пачки. insert пишет
+готовые кортежи значений одним подготовленным запросом через executemany.
+Сигналы и save() при этом не вызываются: счётчики, ленты и кэш после
+массовой записи пересчитываются отдельно (recount_stats, rebuild_timelines).
+"""
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connections, models, router, transaction
+from django.db.models import Max
+
+BATCH_SIZE = 5000
+
+
+def batched(iterable, size=BATCH_SIZE):
+    """Разбивает поток на списки по size штук."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def next_id(model):
+    """
+    Первый свободный первичный ключ. SQLite не возвращает id из массовой
+    вставки, поэтому ключи назначаются заранее.
+    """
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def writer(model, fields, ignore_conflicts=False):
+    """
+    Функция, записывающая пачку кортежей (значения в порядке fields,
+    для внешних ключей — id) одним executemany. Транзакцией управляет
+    вызывающий код.
+    """
+    connection = connections[router.db_for_write(model)]
+    ops = connection.ops
+    fields = [model._meta.get_field(name) for name in fields]
+    sql = '{} {} ({}) VALUES ({}) {}'.format(
+        ops.insert_statement(ignore_conflicts=ignore_conflicts),
+        ops.quote_name(model._meta.db_table),
+        ', '.join(ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+        ops.ignore_conflicts_suffix_sql(ignore_conflicts=ignore_conflicts),
+    )
+    # Приводить к формату базы нужно только даты, остальное драйвер
+    # принимает как есть
+    dates = [
+        index for index, field in enumerate(fields)
+        if isinstance(field, models.DateField)
+    ]
+
+    def write(batch):
+        if dates:
+            batch = [list(row) for row in batch]
+            for row in batch:
+                for index in dates:
+                    row[index] = fields[index].get_db_prep_save(
+                        row[index], connection
+                    )
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+
+    write.using = connection.alias
+    return write
+
+
+def insert(model, fields, rows, batch_size=BATCH_SIZE,
+           ignore_conflicts=False):
+    """
+    Записывает поток кортежей rows пачками по batch_size, каждая пачка
+    в своей транзакции. Возвращает число переданных строк.
+    """
+    write = writer(model, fields, ignore_conflicts)
+    total = 0
+    for batch in batched(rows, batch_size):
+        with transaction.atomic(using=write.using):
+            write(batch)
+        total += len(batch)
+    return total
+
+
+def reset_sequences(*models):
+    """
+    Сдвигает последовательности первичных ключей после вставки с явными
+    id (SQLite делает это сам, PostgreSQL — нет).
+    """
+    connection = connections[router.db_for_write(models[0])]
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,90 @@
+"""
+Денормализованные счётчики: число комментариев поста и статистика автора,
+а также версии карточек постов для кэша шаблонов.
+
+Функции вызываются из обработчиков сигналов, поэтому выполняются в той же
+транзакции, что и запись Comment, Follow или Post.
+"""
+from django.db.models import (
+    BooleanField, Count, Exists, F, OuterRef, Subquery, Value,
+)
+from django.db.models.functions import Coalesce, Greatest
+
+from . import feed_cache
+from .models import AuthorStats, Comment, Follow, Post, User
+
+
+def _shifted(field, delta):
+    """
+    F(field) + delta, но не меньше нуля: счётчики — PositiveIntegerField,
+    и уменьшение разошедшегося до нуля счётчика иначе нарушило бы CHECK.
+    """
+    return Greatest(F(field) + delta, 0)
+
+
+def change_comment_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=_shifted('comment_count', delta),
+        version=F('version') + 1,
+    )
+
+
+def bump_version(posts):
+    """Сбрасывает закэшированные карточки постов из queryset posts."""
+    posts.update(version=F('version') + 1)
+
+
+def change_stats(user_id, delta, *fields):
+    AuthorStats.objects.filter(user_id=user_id).update(
+        **{field: _shifted(field, delta) for field in fields}
+    )
+
+
+def author_cards(viewer):
+    """
+    Пользователи для карточки автора: статистика из AuthorStats и флаг
+    is_followed — подписан ли на автора viewer — читаются одним запросом.
+    """
+    if viewer.is_authenticated:
+        is_followed = Exists(
+            Follow.objects.filter(user=viewer, author=OuterRef('pk'))
+        )
+    else:
+        is_followed = Value(False, output_field=BooleanField())
+    return User.objects.select_related('stats').annotate(
+        is_followed=is_followed
+    )
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def recount():
+    """Пересчитывает все счётчики по исходным таблицам."""
+    AuthorStats.objects.bulk_create(
+        [
+            AuthorStats(user_id=user_id)
+            for user_id in User.objects.values_list('pk', flat=True)
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    comments = _count(Comment.objects, 'post')
+    # Исправленные карточки должны перерисоваться, а не ждать истечения
+    # кэша шаблонов
+    Post.objects.exclude(comment_count=comments).update(
+        comment_count=comments, version=F('version') + 1,
+    )
+    AuthorStats.objects.update(
+        posts_count=_count(Post.objects, 'author'),
+        followers_count=_count(Follow.objects, 'author'),
+        following_count=_count(Follow.objects, 'user'),
+    )
+    feed_cache.bump(feed_cache.ALL)
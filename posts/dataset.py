@@ -0,0 +1,221 @@
+"""
+Синтетический набор данных для замеров производительности.
+
+Пользователи, группы, посты, комментарии и подписки пишутся пачками
+через bulk.insert с заранее назначенными ключами. Популярность авторов,
+групп и постов распределена по степенному закону: небольшая доля авторов
+пишет большую часть постов и собирает большую часть подписчиков.
+При одинаковых seed и end набор получается одинаковым.
+"""
+import random
+from datetime import timedelta
+from io import BytesIO
+
+from PIL import Image
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from . import bulk, counters, feed_cache, follow_graph, timeline
+from .models import Comment, Follow, Group, Post, TimelineEntry, User
+
+# Чем больше показатель, тем сильнее перекос к первым элементам
+SKEW = 3
+GROUP_SHARE = 0.6
+IMAGE_POOL = 16
+
+USER_FIELDS = (
+    'id', 'username', 'first_name', 'last_name', 'email', 'password',
+    'is_superuser', 'is_staff', 'is_active', 'date_joined',
+)
+GROUP_FIELDS = ('id', 'title', 'slug', 'description')
+POST_FIELDS = (
+    'id', 'text', 'pub_date', 'author', 'group', 'image',
+    'comment_count', 'version',
+)
+COMMENT_FIELDS = ('post', 'author', 'text', 'created')
+FOLLOW_FIELDS = ('user', 'author')
+
+WORDS = (
+    'город', 'дорога', 'утро', 'вечер', 'кофе', 'книга', 'фильм', 'музыка',
+    'друзья', 'работа', 'отпуск', 'море', 'горы', 'лес', 'река', 'поезд',
+    'самолёт', 'погода', 'дождь', 'снег', 'солнце', 'кот', 'собака',
+    'рецепт', 'пирог', 'ужин', 'завтрак', 'прогулка', 'парк', 'выставка',
+    'концерт', 'театр', 'спорт', 'бег', 'велосипед', 'проект', 'код',
+    'python', 'django', 'база', 'данных', 'запрос', 'сервер', 'новости',
+    'история', 'фото', 'путешествие', 'озеро', 'мост', 'улица', 'дом',
+    'сад', 'цветы', 'осень', 'весна', 'лето', 'зима', 'праздник', 'день',
+    'неделя', 'планы', 'мысли', 'идея', 'вопрос', 'ответ', 'очень',
+    'сегодня', 'завтра', 'вчера', 'снова', 'наконец', 'красивый', 'новый',
+)
+
+
+def parse_scale(value):
+    """'10k' -> 10000, '1M' -> 1000000."""
+    multipliers = {'k': 10 ** 3, 'm': 10 ** 6}
+    value = value.strip().lower()
+    if value and value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+
+def skewed(rng, count):
+    """Индекс от 0 до count - 1 со степенным перекосом к началу."""
+    return int(count * rng.random() ** SKEW)
+
+
+class Dataset:
+    def __init__(self, posts, seed=0, users=None, groups=None,
+                 comments_per_post=2.0, follows_per_user=20,
+                 image_share=0.0, days=365, end=None, prefix='synthetic'):
+        self.posts = posts
+        self.users = users or max(posts // 20, 10)
+        self.groups = groups or max(self.users // 100, 5)
+        self.comments = int(posts * comments_per_post)
+        self.follows_per_user = follows_per_user
+        self.image_share = image_share
+        self.seed = seed
+        self.prefix = prefix
+        self.end = end or timezone.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        self.start = self.end - timedelta(days=days)
+        self.step = (self.end - self.start) / max(posts, 1)
+        self.rng = random.Random(seed)
+
+    def generate(self, log=lambda message: None, timelines=True):
+        """
+        Записывает набор и пересчитывает производные данные. Материализованные
+        ленты занимают порядка «подписки × TIMELINE_BACKFILL_LIMIT» строк,
+        на больших наборах их можно не строить (timelines=False) и собрать
+        позже командой rebuild_timelines.
+        """
+        self.first_user = bulk.next_id(User)
+        self.first_group = bulk.next_id(Group)
+        self.first_post = bulk.next_id(Post)
+        images = self.make_images() if self.image_share else []
+
+        created = {}
+        created['users'] = bulk.insert(User, USER_FIELDS, self.iter_users())
+        log(f'Пользователей: {created["users"]}')
+        created['groups'] = bulk.insert(
+            Group, GROUP_FIELDS, self.iter_groups()
+        )
+        log(f'Групп: {created["groups"]}')
+        created['posts'] = bulk.insert(
+            Post, POST_FIELDS, self.iter_posts(images)
+        )
+        log(f'Постов: {created["posts"]}')
+        created['comments'] = bulk.insert(
+            Comment, COMMENT_FIELDS, self.iter_comments()
+        )
+        log(f'Комментариев: {created["comments"]}')
+        created['follows'] = bulk.insert(
+            Follow, FOLLOW_FIELDS, self.iter_follows(), ignore_conflicts=True
+        )
+        log(f'Подписок: {created["follows"]}')
+        bulk.reset_sequences(User, Group, Post)
+
+        counters.recount()
+        follow_graph.invalidate()
+        log('Счётчики пересчитаны')
+        if timelines:
+            timeline.rebuild_all()
+            log(f'Записей в лентах: {TimelineEntry.objects.count()}')
+        # Массовая запись идёт мимо сигналов: закэшированные ленты
+        # сбрасываются явно, как и граф подписок
+        feed_cache.bump(feed_cache.ALL)
+        return created
+
+    def user_id(self, index):
+        return self.first_user + index
+
+    def pub_date(self, index):
+        return self.start + self.step * index
+
+    def make_images(self):
+        """Небольшой пул картинок, на которые ссылаются посты."""
+        names = []
+        for number in range(IMAGE_POOL):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            buffer = BytesIO()
+            Image.new('RGB', (640, 480), color).save(buffer, 'JPEG')
+            names.append(default_storage.save(
+                f'posts/{self.prefix}_{self.seed}_{number}.jpg',
+                ContentFile(buffer.getvalue()),
+            ))
+        return names
+
+    def iter_users(self):
+        # Пароль один на всех и непригодный для входа: хэшировать
+        # его для каждого пользователя слишком долго
+        password = make_password(None)
+        joined = self.start - timedelta(days=1)
+        for index in range(self.users):
+            pk = self.user_id(index)
+            yield (
+                pk, f'{self.prefix}{pk}', self.rng.choice(WORDS).capitalize(),
+                '', '', password, False, False, True, joined,
+            )
+
+    def iter_groups(self):
+        for index in range(self.groups):
+            pk = self.first_group + index
+            title = f'{self.rng.choice(WORDS).capitalize()} {pk}'
+            yield pk, title, f'{self.prefix}-{pk}', self.text()
+
+    def iter_posts(self, images):
+        for index in range(self.posts):
+            group_id = None
+            if self.rng.random() < GROUP_SHARE:
+                group_id = self.first_group + skewed(self.rng, self.groups)
+            image = ''
+            if images and self.rng.random() < self.image_share:
+                image = self.rng.choice(images)
+            yield (
+                self.first_post + index,
+                self.text(),
+                self.pub_date(index),
+                self.user_id(skewed(self.rng, self.users)),
+                group_id,
+                image,
+                0,
+                0,
+            )
+
+    def iter_comments(self):
+        for _ in range(self.comments):
+            # Чаще комментируют свежие посты
+            index = self.posts - 1 - skewed(self.rng, self.posts)
+            created = self.pub_date(index) + timedelta(
+                hours=self.rng.expovariate(1 / 12)
+            )
+            yield (
+                self.first_post + index,
+                self.user_id(self.rng.randrange(self.users)),
+                self.text(words=8),
+                min(created, self.end),
+            )
+
+    def iter_follows(self):
+        for index in range(self.users):
+            # Число подписок тоже с тяжёлым хвостом, в среднем
+            # follows_per_user (среднее Парето с alpha=2 равно 2)
+            wanted = min(
+                int(self.follows_per_user / 2 * self.rng.paretovariate(2)),
+                self.users - 1,
+            )
+            authors = set()
+            for _ in range(wanted * 3):
+                if len(authors) == wanted:
+                    break
+                author = skewed(self.rng, self.users)
+                if author != index:
+                    authors.add(author)
+            for author in sorted(authors):
+                yield self.user_id(index), self.user_id(author)
+
+    def text(self, words=30):
+        count = 3 + skewed(self.rng, words)
+        return ' '.join(self.rng.choices(WORDS, k=count)).capitalize()
@@ -0,0 +1,79 @@
+"""
+Потоковая выгрузка постов автора или группы вместе с комментариями.
+
+Посты читаются через iterator() порциями, комментарии догружаются одним
+запросом на пачку постов, а результат отдаётся построчно. В памяти
+одновременно находится только одна пачка, сколько бы постов ни было.
+Записи JSONL совместимы с форматом import_content для постов.
+"""
+import csv
+import json
+
+from . import bulk
+from .models import Comment
+
+CHUNK_SIZE = 500
+CSV_FIELDS = ('type', 'id', 'post', 'author', 'group', 'text', 'date', 'image')
+
+
+def iter_posts(posts, chunk_size=CHUNK_SIZE):
+    """Словари постов со списком комментариев в поле comments."""
+    rows = posts.order_by('pk').values_list(
+        'id', 'author__username', 'group__slug', 'text', 'pub_date', 'image'
+    ).iterator(chunk_size=chunk_size)
+    for batch in bulk.batched(rows, chunk_size):
+        comments = {}
+        for post_id, author, text, created in Comment.objects.filter(
+            post_id__in=[row[0] for row in batch]
+        ).order_by('post_id', 'created', 'pk').values_list(
+            'post_id', 'author__username', 'text', 'created'
+        ):
+            comments.setdefault(post_id, []).append({
+                'author': author,
+                'text': text,
+                'created': created.isoformat(),
+            })
+        for post_id, author, group, text, pub_date, image in batch:
+            yield {
+                'id': post_id,
+                'author': author,
+                'group': group,
+                'text': text,
+                'pub_date': pub_date.isoformat(),
+                'image': image or '',
+                'comments': comments.get(post_id, []),
+            }
+
+
+def as_jsonl(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+class _Line:
+    """Файлоподобный объект, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def as_csv(records):
+    """Строка на пост и строка на каждый его комментарий."""
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_FIELDS)
+    for record in records:
+        yield writer.writerow([
+            'post', record['id'], '', record['author'], record['group'] or '',
+            record['text'], record['pub_date'], record['image'],
+        ])
+        for comment in record['comments']:
+            yield writer.writerow([
+                'comment', '', record['id'], comment['author'], '',
+                comment['text'], comment['created'], '',
+            ])
+
+
+FORMATS = {
+    'jsonl': (as_jsonl, 'application/x-ndjson; charset=utf-8'),
+    'csv': (as_csv, 'text/csv; charset=utf-8'),
+}
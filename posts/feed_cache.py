@@ -0,0 +1,115 @@
+"""
+Кэш страниц лент с инвалидацией по поколениям.
+
+У каждой ленты (главная, группа, профиль) есть счётчик поколения в кэше.
+Ключ закэшированной страницы включает текущее поколение, поэтому запись,
+меняющая ленту, увеличивает счётчик, и старые страницы просто перестают
+читаться. Поколение 'all' сбрасывает все ленты сразу.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import replicas
+
+from . import write_queue
+from .models import Group, Post
+
+ALL = 'all'
+
+
+def _generation_key(feed):
+    return f'feed_generation:{feed}'
+
+
+def index_feed():
+    return 'index'
+
+
+def group_feed(slug):
+    return f'group:{slug}'
+
+
+def profile_feed(username):
+    return f'profile:{username}'
+
+
+def trending_feed(slug=None):
+    # Все страницы популярного сбрасываются вместе: их меняет пересчёт
+    return 'trending'
+
+
+def bump(*feeds):
+    for feed in feeds:
+        key = _generation_key(feed)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def bump_post(post, group_ids=()):
+    """
+    Сбрасывает ленты, в которых показывается пост; group_ids — группы,
+    из которых пост мог уйти при редактировании.
+    """
+    feeds = [
+        index_feed(), trending_feed(), profile_feed(post.author.username)
+    ]
+    group_ids = {post.group_id, *group_ids} - {None}
+    if post.group_id and Post.group.is_cached(post):
+        feeds.append(group_feed(post.group.slug))
+        group_ids.discard(post.group_id)
+    if group_ids:
+        slugs = Group.objects.filter(
+            pk__in=group_ids
+        ).values_list('slug', flat=True)
+        feeds += [group_feed(slug) for slug in slugs]
+    bump(*feeds)
+
+
+def cache_feed(feed_func):
+    """
+    Кэширует GET-ответы вьюхи до смены поколения ленты feed_func(**kwargs),
+    где kwargs — именованные параметры маршрута.
+    Страницы различаются по пользователю: в них есть его меню и кнопки.
+    Страница, прочитанная с отстающей реплики, может не содержать свежую
+    запись уже нового поколения, поэтому живёт не дольше окна липкости.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            feed = feed_func(**kwargs)
+            keys = [_generation_key(feed), _generation_key(ALL)]
+            if request.user.is_authenticated:
+                keys.append(write_queue.overlay_key(request.user.pk))
+            generations = cache.get_many(keys)
+            if len(keys) == 3 and keys[2] in generations:
+                # У пользователя недавно были записи в очереди, страница
+                # из кэша могла бы их не показать
+                return view(request, *args, **kwargs)
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = 'feed_page:{}:{}:{}:{}:{}'.format(
+                feed,
+                generations.get(_generation_key(feed), 0),
+                generations.get(_generation_key(ALL), 0),
+                request.user.pk or 0,
+                path,
+            )
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    timeout = getattr(
+                        settings, 'FEED_CACHE_TIMEOUT', 60 * 60 * 24
+                    )
+                    if replicas.reading_from_replica():
+                        timeout = min(timeout, replicas.sticky_seconds())
+                    cache.set(key, response, timeout)
+            return response
+        return wrapper
+    return decorator
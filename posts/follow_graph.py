@@ -0,0 +1,309 @@
+"""
+Граф подписок в памяти процесса.
+
+Для каждого пользователя хранятся два отсортированных массива id:
+на кого он подписан и кто подписан на него. Проверка подписки — бинарный
+поиск, счётчики — длина массива, общие подписки и рекомендации
+«кого читать» — проход по спискам друзей без запросов к базе. Ребро
+занимает 8 байт (по 4 в каждом направлении), так что граф из миллионов
+подписок помещается в десятки мегабайт.
+
+Граф загружается из базы при первом обращении. Подписки и отписки после
+коммита записываются в журнал в общем кэше под возрастающими номерами;
+каждый процесс при обращении к графу догоняет журнал со своего номера.
+Если записи журнала пропали или отставание больше GRAPH_REPLAY_LIMIT,
+граф загружается заново в фоновом потоке. Массовые загрузки в обход
+сигналов вызывают invalidate(); на случай прочих расхождений граф
+перечитывается не реже раза в FOLLOW_GRAPH_MAX_AGE секунд.
+"""
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import Follow
+
+GENERATION_KEY = 'follow_graph:generation'
+SEQUENCE_KEY = 'follow_graph:sequence'
+GRAPH_REPLAY_LIMIT = 1000
+LOAD_CHUNK_SIZE = 10000
+
+logger = logging.getLogger(__name__)
+
+
+def _change_key(generation):
+    return f'follow_graph:change:{generation}'
+
+
+def max_age():
+    return getattr(settings, 'FOLLOW_GRAPH_MAX_AGE', 60 * 60)
+
+
+def _contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def _insert(index, key, value):
+    ids = index.get(key)
+    if ids is None:
+        index[key] = array('I', [value])
+        return True
+    position = bisect_left(ids, value)
+    if position < len(ids) and ids[position] == value:
+        return False
+    ids.insert(position, value)
+    return True
+
+
+def _remove(index, key, value):
+    ids = index.get(key)
+    if ids is None:
+        return False
+    position = bisect_left(ids, value)
+    if position == len(ids) or ids[position] != value:
+        return False
+    del ids[position]
+    if not ids:
+        del index[key]
+    return True
+
+
+class FollowGraph:
+    """Подписки в виде двух индексов: user -> авторы и author -> читатели."""
+
+    _empty = array('I')
+
+    def __init__(self):
+        self.following = {}
+        self.followers = {}
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Граф из пар (user_id, author_id) в любом порядке."""
+        following = {}
+        followers = {}
+        for user_id, author_id in pairs:
+            following.setdefault(user_id, []).append(author_id)
+            followers.setdefault(author_id, []).append(user_id)
+        graph = cls()
+        for source, target in (
+            (following, graph.following), (followers, graph.followers)
+        ):
+            while source:
+                key, ids = source.popitem()
+                target[key] = array('I', sorted(set(ids)))
+        return graph
+
+    def follow(self, user_id, author_id):
+        if not _insert(self.following, user_id, author_id):
+            return False
+        _insert(self.followers, author_id, user_id)
+        return True
+
+    def unfollow(self, user_id, author_id):
+        if not _remove(self.following, user_id, author_id):
+            return False
+        _remove(self.followers, author_id, user_id)
+        return True
+
+    def is_following(self, user_id, author_id):
+        return _contains(self.following.get(user_id, self._empty), author_id)
+
+    def following_count(self, user_id):
+        return len(self.following.get(user_id, self._empty))
+
+    def followers_count(self, author_id):
+        return len(self.followers.get(author_id, self._empty))
+
+    def mutuals(self, user_id):
+        """Авторы, на которых user подписан и которые подписаны на него."""
+        followers = self.followers.get(user_id, self._empty)
+        return [
+            author_id
+            for author_id in self.following.get(user_id, self._empty)
+            if _contains(followers, author_id)
+        ]
+
+    def suggestions(self, user_id, limit=5, scan=200):
+        """
+        Авторы, которых читают авторы из подписок user, но не он сам.
+        Упорядочены по числу таких общих связей, затем по числу
+        подписчиков. Просматриваются не больше scan подписок на каждом
+        шаге, чтобы время не зависело от размера графа.
+        """
+        following = self.following.get(user_id, self._empty)
+        scores = Counter()
+        for friend_id in following[:scan]:
+            for author_id in self.following.get(friend_id, self._empty)[:scan]:
+                if author_id != user_id and not _contains(
+                    following, author_id
+                ):
+                    scores[author_id] += 1
+        ranked = sorted(
+            scores.items(),
+            key=lambda item: (-item[1], -self.followers_count(item[0]),
+                              item[0]),
+        )
+        return [author_id for author_id, score in ranked[:limit]]
+
+    def memory(self):
+        """Примерный объём массивов и словарей в байтах."""
+        total = 0
+        for index in (self.following, self.followers):
+            total += index.__sizeof__()
+            total += sum(ids.__sizeof__() for ids in index.values())
+        return total
+
+
+_graph = None
+_generation = None
+_loaded_at = 0.0
+_reloading = False
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+
+
+def load():
+    """Читает все подписки из базы."""
+    return FollowGraph.from_pairs(
+        Follow.objects.order_by().values_list(
+            'user_id', 'author_id'
+        ).iterator(chunk_size=LOAD_CHUNK_SIZE)
+    )
+
+
+def _replay(graph, start, end):
+    """Применяет изменения журнала с номерами start..end; False — пробел."""
+    keys = [_change_key(number) for number in range(start, end + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return False
+    for key in keys:
+        user_id, author_id, followed = changes[key]
+        if followed:
+            graph.follow(user_id, author_id)
+        else:
+            graph.unfollow(user_id, author_id)
+    return True
+
+
+def _in_memory_db():
+    """
+    База SQLite в памяти (тесты): как и миниатюры, граф перечитывается
+    в потоке запроса, а не в фоновом.
+    """
+    return connection.vendor == 'sqlite' and connection.is_in_memory_db()
+
+
+def _reload(generation):
+    global _graph, _generation, _loaded_at
+    graph = load()
+    with _lock:
+        _graph = graph
+        _generation = generation
+        _loaded_at = time.monotonic()
+
+
+def _reload_in_background(generation):
+    global _reloading
+    try:
+        _reload(generation)
+    except Exception:
+        logger.exception('Ошибка загрузки графа подписок')
+    finally:
+        with _lock:
+            _reloading = False
+        connection.close()
+
+
+def get():
+    """
+    Граф подписок процесса, догнавший журнал изменений. Если журнал
+    догнать нельзя, граф перечитывается в фоновом потоке, а до конца
+    загрузки запросы читают прежний граф. Синхронно граф загружается
+    только при первом обращении.
+    """
+    global _generation, _reloading
+    # Номер читается до загрузки: изменения, закоммиченные во время
+    # неё, будут применены повторно, а это безопасно
+    generation = cache.get(GENERATION_KEY)
+    with _lock:
+        graph = _graph
+        fresh = time.monotonic() - _loaded_at < max_age()
+        if graph is not None and fresh and generation == _generation:
+            return graph
+        if (
+            graph is not None
+            and fresh
+            and isinstance(_generation, int)
+            and isinstance(generation, int)
+            and 0 < generation - _generation <= GRAPH_REPLAY_LIMIT
+            and _replay(graph, _generation + 1, generation)
+        ):
+            _generation = generation
+            return graph
+        if graph is not None and not _in_memory_db():
+            if not _reloading:
+                _reloading = True
+                threading.Thread(
+                    target=_reload_in_background, args=(generation,),
+                    name='follow-graph', daemon=True,
+                ).start()
+            return graph
+    with _load_lock:
+        # Другой запрос мог загрузить граф, пока этот ждал
+        if _graph is graph:
+            _reload(generation)
+    return _graph
+
+
+def _reset():
+    """
+    Сбрасывает номера журнала, если кэш их потерял. Новое значение
+    больше любого прежнего номера, поэтому старые записи журнала не
+    применятся, а все процессы перечитают граф.
+    """
+    number = time.time_ns()
+    cache.set_many({SEQUENCE_KEY: number, GENERATION_KEY: number}, None)
+
+
+def record(user_id, author_id, followed):
+    """
+    Записывает подписку или отписку в журнал после коммита. Номер
+    берётся из SEQUENCE_KEY, а GENERATION_KEY, который читают процессы,
+    увеличивается только после записи изменения: иначе процесс мог бы
+    увидеть номер раньше записи и принять её за пропавшую.
+    """
+    def write():
+        try:
+            number = cache.incr(SEQUENCE_KEY)
+        except ValueError:
+            _reset()
+            return
+        cache.set(
+            _change_key(number), (user_id, author_id, followed), max_age(),
+        )
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            _reset()
+    transaction.on_commit(write)
+
+
+def invalidate():
+    """
+    Заставляет все процессы перечитать граф из базы: номер без записи
+    журнала они примут за пробел.
+    """
+    try:
+        cache.incr(SEQUENCE_KEY)
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        _reset()
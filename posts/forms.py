@@ -1,6 +1,8 @@
+from django.core.files.uploadedfile import UploadedFile
 from django.utils.translation import gettext_lazy as _
 from django.forms import ModelForm, Textarea
 
+from . import uploads
 from .models import Post, Comment
 
 
@@ -21,6 +23,25 @@ class PostForm(ModelForm):
             'text': Textarea(attrs={'cols': 80, 'rows': 20})
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Оборванный при загрузке файл ImageField счёл бы испорченной
+        # картинкой; убираем его, чтобы сообщить именно о размере
+        self.oversized = None
+        upload = self.files.get('image')
+        if getattr(upload, 'oversized', False):
+            self.files = self.files.copy()
+            self.oversized = self.files.pop('image')[0]
+
+    def clean_image(self):
+        if self.oversized is not None:
+            uploads.check_size(self.oversized)
+        image = self.cleaned_data.get('image')
+        # Новая загрузка; уже сохранённая картинка приходит как FieldFile
+        if isinstance(image, UploadedFile):
+            return uploads.normalize(image)
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
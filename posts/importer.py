@@ -0,0 +1,205 @@
+"""
+Потоковый импорт контента со старой платформы из JSONL или CSV.
+
+Файл читается построчно, строки пишутся пачками через bulk.writer;
+каждая пачка вместе с позицией в файле (ImportCheckpoint) сохраняется
+в одной транзакции. Память не зависит от размера файла: в ней держатся
+только текущая пачка и словари username -> id и slug -> id.
+
+Ссылки в записях — естественные ключи: автор и подписчик по username,
+группа по slug. Посты сохраняют id исходной платформы (со сдвигом
+id_offset), поэтому комментарии ссылаются на пост без словаря в памяти.
+Занятый id поста — ошибка, а не пропуск: иначе комментарии
+импортированного поста достались бы чужому посту с тем же id.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import bulk
+from .models import Comment, Follow, Group, ImportCheckpoint, Post, User
+
+KINDS = ('users', 'groups', 'posts', 'comments', 'follows')
+
+
+def read_records(file, format):
+    """Поток словарей из JSONL или CSV; пустые строки JSONL пропускаются."""
+    if format == 'csv':
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f'Неверная дата: {value}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+class Importer:
+    def __init__(self, kind, source, id_offset=0,
+                 batch_size=bulk.BATCH_SIZE):
+        if kind not in KINDS:
+            raise ValueError(f'Неизвестный тип записей: {kind}')
+        self.kind = kind
+        self.source = source
+        self.id_offset = id_offset
+        self.batch_size = batch_size
+        self.skipped = 0
+        # Войти с импортированным паролем нельзя, только сбросить его
+        self._password = make_password(None)
+        self._users = None
+        self._groups = None
+
+    def run(self, records, log=lambda message: None):
+        """
+        Импортирует записи, пропуская уже сохранённые по контрольной
+        точке. Возвращает число обработанных записей.
+        """
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(
+            source=self.source
+        )
+        if checkpoint.position:
+            log(f'Продолжение с записи {checkpoint.position}')
+        elif self.kind == 'posts':
+            self.check_id_range()
+        records = islice(records, checkpoint.position, None)
+        fields, ignore_conflicts = self.target()
+        write = bulk.writer(self.model(), fields, ignore_conflicts)
+        processed = 0
+        for batch in bulk.batched(records, self.batch_size):
+            rows = self.convert_batch(batch)
+            with transaction.atomic(using=write.using):
+                if rows:
+                    write(rows)
+                checkpoint.position += len(batch)
+                checkpoint.save(update_fields=['position', 'updated'])
+            processed += len(batch)
+            log(f'Записей: {checkpoint.position}')
+        if self.kind in ('groups', 'posts'):
+            bulk.reset_sequences(self.model())
+        return processed
+
+    def model(self):
+        return {
+            'users': User, 'groups': Group, 'posts': Post,
+            'comments': Comment, 'follows': Follow,
+        }[self.kind]
+
+    def target(self):
+        """Поля вставки и нужно ли пропускать уже существующие строки."""
+        return {
+            'users': (
+                ('username', 'first_name', 'last_name', 'email',
+                 'password', 'is_superuser', 'is_staff', 'is_active',
+                 'date_joined'),
+                True,
+            ),
+            'groups': (('slug', 'title', 'description'), True),
+            'posts': (
+                ('id', 'text', 'pub_date', 'author', 'group', 'image',
+                 'comment_count', 'version'),
+                False,
+            ),
+            'comments': (('post', 'author', 'text', 'created'), False),
+            'follows': (('user', 'author'), True),
+        }[self.kind]
+
+    def check_id_range(self):
+        """
+        Новый импорт постов пишет в id больше id_offset: они должны быть
+        свободны.
+        """
+        last = Post.objects.filter(pk__gt=self.id_offset).order_by(
+            '-pk'
+        ).values_list('pk', flat=True).first()
+        if last is not None:
+            raise ValueError(
+                f'Посты с id больше {self.id_offset} уже есть в базе, '
+                f'задайте --id-offset не меньше {last}'
+            )
+
+    def convert_batch(self, batch):
+        """
+        Кортежи значений для вставки. Записи со ссылками на отсутствующие
+        объекты пропускаются и считаются в skipped.
+        """
+        convert = getattr(self, f'convert_{self.kind}')
+        rows = [row for row in map(convert, batch) if row is not None]
+        if self.kind == 'comments':
+            # Посты не держим в памяти: проверяем одним запросом на пачку
+            existing = set(Post.objects.filter(
+                pk__in={row[0] for row in rows}
+            ).values_list('pk', flat=True))
+            rows = [row for row in rows if row[0] in existing]
+        if self.kind == 'posts':
+            # Посты, созданные на сайте во время импорта
+            taken = list(Post.objects.filter(
+                pk__in=[row[0] for row in rows]
+            ).values_list('pk', flat=True))
+            if taken:
+                raise ValueError(f'id постов уже заняты: {sorted(taken)}')
+        self.skipped += len(batch) - len(rows)
+        return rows
+
+    def convert_users(self, record):
+        return (
+            record['username'], record.get('first_name') or '',
+            record.get('last_name') or '', record.get('email') or '',
+            self._password, False, False, True,
+            parse_date(record.get('date_joined')),
+        )
+
+    def convert_groups(self, record):
+        return (
+            record['slug'], record['title'], record.get('description') or '',
+        )
+
+    def convert_posts(self, record):
+        author_id = self.users().get(record['author'])
+        group_id = self.groups().get(record.get('group') or '')
+        if author_id is None or (record.get('group') and group_id is None):
+            return None
+        return (
+            int(record['id']) + self.id_offset, record['text'],
+            parse_date(record.get('pub_date')), author_id, group_id,
+            record.get('image') or '', 0, 0,
+        )
+
+    def convert_comments(self, record):
+        author_id = self.users().get(record['author'])
+        if author_id is None:
+            return None
+        return (
+            int(record['post']) + self.id_offset, author_id, record['text'],
+            parse_date(record.get('created')),
+        )
+
+    def convert_follows(self, record):
+        user_id = self.users().get(record['user'])
+        author_id = self.users().get(record['author'])
+        if None in (user_id, author_id) or user_id == author_id:
+            return None
+        return user_id, author_id
+
+    def users(self):
+        if self._users is None:
+            self._users = dict(User.objects.values_list('username', 'id'))
+        return self._users
+
+    def groups(self):
+        if self._groups is None:
+            self._groups = dict(Group.objects.values_list('slug', 'id'))
+        return self._groups
@@ -0,0 +1,83 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from core.benchmark import PERCENTILES, LoadTest, database_settings
+from posts.benchmarks import load_scenarios
+
+# Настройки SQLite и Django по умолчанию. journal_mode хранится в файле
+# базы, поэтому его нужно вернуть явно, если база уже переведена в WAL.
+DEFAULT_MODE = {
+    'CONN_MAX_AGE': 0,
+    'OPTIONS': {
+        'pragmas': {'journal_mode': 'delete', 'synchronous': 'full'},
+        'transaction_mode': 'DEFERRED',
+    },
+}
+
+MODES = ('default', 'configured')
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет пропускную способность при одновременных чтениях и '
+        'записях: с настройками SQLite по умолчанию и из DATABASES'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--duration', type=float, default=10.0,
+            help='секунд на каждый режим',
+        )
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument(
+            '--mode', action='append', dest='modes', choices=MODES,
+            help='режим базы; по умолчанию оба',
+        )
+        parser.add_argument('--output', help='куда сохранить результаты')
+
+    # Лимиты частоты записей замеряли бы ответ 429, а не запись
+    @override_settings(DEBUG=False, RATE_LIMITS={})
+    def handle(self, *args, **options):
+        scenarios = load_scenarios(options['writers'])
+        if scenarios is None:
+            raise CommandError(
+                'В базе нет данных для замера, сначала generate_dataset'
+            )
+        results = {}
+        for mode in options['modes'] or MODES:
+            overrides = DEFAULT_MODE if mode == 'default' else {}
+            with database_settings(overrides):
+                results[mode] = LoadTest(
+                    scenarios, options['threads'], options['duration']
+                ).run()
+
+        columns = [f'p{rank}_ms' for rank in PERCENTILES]
+        self.stdout.write(
+            f'{"режим":<12}{"запросов":>10}{"в секунду":>11}'
+            + ''.join(f'{c:>10}' for c in columns) + '  статусы'
+        )
+        for mode, result in results.items():
+            self.stdout.write(
+                f'{mode:<12}{result["requests"]:>10}'
+                f'{result["throughput_rps"]:>11.1f}'
+                + ''.join(f'{result[c]:>10.2f}' for c in columns) + '  '
+                + ', '.join(
+                    f'{status}: {count}'
+                    for status, count in result['status'].items()
+                )
+            )
+            for error, count in result['errors'].items():
+                self.stdout.write(f'    {count} x {error}')
+        if len(results) == len(MODES) and results['default']['requests']:
+            gain = (
+                results['configured']['throughput_rps']
+                / results['default']['throughput_rps']
+            )
+            self.stdout.write(f'Прирост пропускной способности: x{gain:.2f}')
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
@@ -0,0 +1,73 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from core.benchmark import PERCENTILES, Benchmark, compare
+from posts.benchmarks import scenarios
+
+
+class Command(BaseCommand):
+    help = 'Замеряет задержку, число запросов и размер ответа вьюх'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--route', action='append', dest='routes',
+            help='имя сценария; по умолчанию все',
+        )
+        parser.add_argument('--output', help='куда сохранить результаты')
+        parser.add_argument(
+            '--baseline', help='JSON прошлого замера для сравнения',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='допустимый рост p95 относительно базового замера',
+        )
+
+    # Ведра лимитов лежат в общем кэше и не откатываются вместе
+    # с транзакцией замера: без этого записи упирались бы в 429
+    @override_settings(RATE_LIMITS={})
+    def handle(self, *args, **options):
+        selected = scenarios()
+        if selected is None:
+            raise CommandError(
+                'В базе нет данных для замера, сначала generate_dataset'
+            )
+        if options['routes']:
+            selected = [
+                scenario for scenario in selected
+                if scenario.name in options['routes']
+            ]
+        results = Benchmark(
+            selected, options['iterations'], options['warmup']
+        ).run()
+
+        columns = [f'p{rank}_ms' for rank in PERCENTILES]
+        self.stdout.write(
+            f'{"сценарий":<18}' + ''.join(f'{c:>10}' for c in columns)
+            + f'{"запросы":>9}{"байты":>9}  статус'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<18}'
+                + ''.join(f'{result[c]:>10.2f}' for c in columns)
+                + f'{result["queries"]:>9.1f}{result["bytes"]:>9}  '
+                + ','.join(map(str, result['status']))
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                regressions = compare(
+                    results, json.load(baseline), options['threshold']
+                )
+            if regressions:
+                raise CommandError(
+                    'Регрессии относительно базового замера:\n'
+                    + '\n'.join(regressions)
+                )
+            self.stdout.write('Регрессий нет')
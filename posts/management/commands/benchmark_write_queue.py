@@ -0,0 +1,81 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from core.benchmark import LoadTest
+from core.db.backends.sqlite3.base import DatabaseWrapper
+from posts import write_queue
+from posts.benchmarks import write_scenarios
+from posts.models import Comment, Follow
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет коммиты в секунду при записи комментариев и подписок: '
+        'по транзакции на запрос и через очередь записи'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--duration', type=float, default=10.0,
+            help='секунд на каждый режим',
+        )
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument(
+            '--interval', type=int, default=50,
+            help='WRITE_QUEUE_INTERVAL в миллисекундах для режима очереди',
+        )
+        parser.add_argument('--output', help='куда сохранить результаты')
+
+    @override_settings(DEBUG=False, RATE_LIMITS={})
+    def handle(self, *args, **options):
+        scenarios = write_scenarios(options['writers'])
+        if scenarios is None:
+            raise CommandError(
+                'В базе нет данных для замера, сначала generate_dataset'
+            )
+        results = {}
+        for mode, interval in (('direct', 0), ('queue', options['interval'])):
+            with override_settings(WRITE_QUEUE_INTERVAL=interval):
+                rows = Comment.objects.count() + Follow.objects.count()
+                commits = DatabaseWrapper.commits
+                result = LoadTest(
+                    scenarios, options['threads'], options['duration']
+                ).run()
+                write_queue.flush()
+                commits = DatabaseWrapper.commits - commits
+                rows = Comment.objects.count() + Follow.objects.count() - rows
+            result['commits_per_second'] = round(
+                commits / result['seconds'], 1
+            )
+            result['rows_per_second'] = round(rows / result['seconds'], 1)
+            results[mode] = result
+            # Подписки режима direct не должны превратить запросы режима
+            # queue в пустые
+            Follow.objects.filter(
+                user__in={scenario.user for scenario in scenarios}
+            ).delete()
+
+        self.stdout.write(
+            f'{"режим":<10}{"запросов/с":>12}{"коммитов/с":>12}'
+            f'{"строк/с":>10}{"p95_ms":>10}  статусы'
+        )
+        for mode, result in results.items():
+            self.stdout.write(
+                f'{mode:<10}{result["throughput_rps"]:>12.1f}'
+                f'{result["commits_per_second"]:>12.1f}'
+                f'{result["rows_per_second"]:>10.1f}'
+                f'{result["p95_ms"]:>10.2f}  '
+                + ', '.join(
+                    f'{status}: {count}'
+                    for status, count in result['status'].items()
+                )
+            )
+            for error, count in result['errors'].items():
+                self.stdout.write(f'    {count} x {error}')
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
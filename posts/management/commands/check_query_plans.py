@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from core.plans import PlanRecorder
+from posts.benchmarks import scenarios
+
+# Ответ из кэша не выполнил бы ни одного запроса, а чистить рабочий
+# кэш ради проверки нельзя
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+}
+
+# Выдача поиска сортируется по релевантности FTS5, индекса для этого
+# порядка не бывает
+UNINDEXED = ('search',)
+# Форма поста показывает список всех групп
+FULL_SCANS_ALLOWED = ('posts_group',)
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет через EXPLAIN QUERY PLAN, что запросы вьюх читают '
+        'индексы, а не всю таблицу, и не сортируют во временном B-дереве'
+    )
+
+    @override_settings(CACHES=NO_CACHE)
+    def handle(self, *args, **options):
+        selected = scenarios()
+        if selected is None:
+            raise CommandError(
+                'В базе нет данных для проверки, сначала generate_dataset'
+            )
+        failures = []
+        for scenario in selected:
+            if scenario.method != 'get' or scenario.name in UNINDEXED:
+                continue
+            client = Client()
+            if scenario.user is not None:
+                client.force_login(scenario.user)
+            with PlanRecorder(FULL_SCANS_ALLOWED) as recorder:
+                client.get(scenario.path, scenario.data)
+            for sql, steps in recorder.report():
+                failures.append(f'{scenario.name}: {"; ".join(steps)}\n{sql}')
+            self.stdout.write(
+                f'{scenario.name}: запросов {len(recorder.queries)}'
+            )
+        if failures:
+            raise CommandError(
+                'Неиндексные планы запросов:\n' + '\n'.join(failures)
+            )
+        self.stdout.write('Все планы используют индексы')
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import exporter
+from posts.models import Group, Post, User
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты автора или группы с комментариями'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--author', help='username автора')
+        source.add_argument('--group', help='slug группы')
+        parser.add_argument(
+            '--format', choices=sorted(exporter.FORMATS), default='jsonl',
+        )
+        parser.add_argument(
+            '--output', help='файл выгрузки; по умолчанию stdout',
+        )
+
+    def handle(self, *args, **options):
+        if options['author']:
+            owner = User.objects.filter(username=options['author']).first()
+            posts = Post.objects.filter(author=owner)
+        else:
+            owner = Group.objects.filter(slug=options['group']).first()
+            posts = Post.objects.filter(group=owner)
+        if owner is None:
+            raise CommandError('Автор или группа не найдены')
+        render_lines = exporter.FORMATS[options['format']][0]
+        lines = render_lines(exporter.iter_posts(posts))
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(
+            options['output'], 'w', newline='', encoding='utf-8'
+        ) as file:
+            file.writelines(lines)
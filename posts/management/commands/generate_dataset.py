@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from posts.dataset import Dataset, parse_scale
+
+
+class Command(BaseCommand):
+    help = 'Генерирует синтетический набор данных для замеров'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', type=parse_scale, default=10000,
+            help='число постов: 10000, 10k, 1M',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--users', type=parse_scale,
+            help='по умолчанию один пользователь на 20 постов',
+        )
+        parser.add_argument(
+            '--groups', type=parse_scale,
+            help='по умолчанию одна группа на 100 пользователей',
+        )
+        parser.add_argument(
+            '--comments-per-post', type=float, default=2.0,
+        )
+        parser.add_argument('--follows-per-user', type=int, default=20)
+        parser.add_argument(
+            '--images', type=float, default=0.0, dest='image_share',
+            help='доля постов с картинкой, от 0 до 1',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='за сколько дней до сегодняшнего распределить посты',
+        )
+        parser.add_argument('--prefix', default='synthetic')
+        parser.add_argument(
+            '--skip-timelines', action='store_true',
+            help='не строить ленты подписок (rebuild_timelines позже)',
+        )
+
+    def handle(self, *args, **options):
+        dataset = Dataset(
+            options['scale'],
+            seed=options['seed'],
+            users=options['users'],
+            groups=options['groups'],
+            comments_per_post=options['comments_per_post'],
+            follows_per_user=options['follows_per_user'],
+            image_share=options['image_share'],
+            days=options['days'],
+            prefix=options['prefix'],
+        )
+        dataset.generate(
+            log=self.stdout.write, timelines=not options['skip_timelines']
+        )
@@ -0,0 +1,52 @@
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post, Thumbnail
+
+
+def generate_chunk(post_ids):
+    created = sum(thumbnails.generate(post_id) for post_id in post_ids)
+    connections.close_all()
+    return created
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры картинок существующих постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='число процессов-генераторов',
+        )
+        parser.add_argument('--chunk-size', type=int, default=100)
+        parser.add_argument(
+            '--force', action='store_true',
+            help='удалить готовые миниатюры и построить заново',
+        )
+
+    def handle(self, *args, **options):
+        if options['force']:
+            Thumbnail.objects.all().delete()
+        post_ids = list(
+            Post.objects.exclude(image='').exclude(image__isnull=True)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+        size = options['chunk_size']
+        chunks = [
+            post_ids[start:start + size]
+            for start in range(0, len(post_ids), size)
+        ]
+        if options['processes'] > 1:
+            # Дочерние процессы не должны делить соединения с родителем
+            connections.close_all()
+            with Pool(options['processes']) as pool:
+                created = sum(pool.imap_unordered(generate_chunk, chunks))
+        else:
+            created = sum(generate_chunk(chunk) for chunk in chunks)
+        self.stdout.write(
+            f'Постов с картинками: {len(post_ids)}, '
+            f'новых миниатюр: {created}'
+        )
@@ -0,0 +1,66 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import counters, feed_cache, follow_graph, importer, timeline
+from posts.models import ImportCheckpoint
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково импортирует пользователей, группы, посты, комментарии '
+        'или подписки из JSONL или CSV'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=importer.KINDS)
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'),
+            help='по умолчанию по расширению файла',
+        )
+        parser.add_argument(
+            '--id-offset', type=int, default=0,
+            help='сдвиг id постов относительно исходной платформы',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='начать файл заново, забыв контрольную точку',
+        )
+        parser.add_argument(
+            '--skip-recount', action='store_true',
+            help='не пересчитывать счётчики и ленты после импорта',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or (
+            'csv' if path.endswith('.csv') else 'jsonl'
+        )
+        source = f'{options["kind"]}:{os.path.abspath(path)}'
+        if options['restart']:
+            ImportCheckpoint.objects.filter(source=source).delete()
+        job = importer.Importer(
+            options['kind'], source, options['id_offset'],
+            options['batch_size'],
+        )
+        try:
+            with open(path, newline='', encoding='utf-8') as file:
+                processed = job.run(
+                    importer.read_records(file, format),
+                    log=self.stdout.write,
+                )
+        except (KeyError, ValueError) as error:
+            raise CommandError(f'Ошибка в записи: {error!r}')
+        self.stdout.write(
+            f'Обработано записей: {processed}, пропущено: {job.skipped}'
+        )
+        if not options['skip_recount'] and processed:
+            counters.recount()
+            follow_graph.invalidate()
+            timeline.rebuild_all()
+            self.stdout.write('Счётчики и ленты пересчитаны')
+        if processed:
+            # Записи импорта идут мимо сигналов, сбрасывающих кэш лент
+            feed_cache.bump(feed_cache.ALL)
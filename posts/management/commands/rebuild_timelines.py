@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed_cache, timeline
+from posts.models import Follow
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает материализованные ленты подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя; по умолчанию все подписчики',
+        )
+
+    def handle(self, *args, **options):
+        users = options['users']
+        if not users:
+            timeline.rebuild_all()
+            feed_cache.bump(feed_cache.ALL)
+            users = Follow.objects.values('user_id').distinct()
+            self.stdout.write(f'Перестроено лент: {users.count()}')
+            return
+        for user_id in users:
+            timeline.rebuild(user_id)
+        feed_cache.bump(feed_cache.ALL)
+        self.stdout.write(f'Перестроено лент: {len(users)}')
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает популярные посты и группы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float,
+            help='повторять каждые N секунд',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            counts = trending.rollup()
+            self.stdout.write(
+                f'Постов: {counts["posts"]}, групп: {counts["groups"]}, '
+                f'{time.perf_counter() - started:.2f} с'
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
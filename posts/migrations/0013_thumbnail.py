@@ -0,0 +1,29 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Thumbnail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('preset', models.CharField(max_length=32)),
+                ('source', models.CharField(max_length=100)),
+                ('url', models.CharField(max_length=255)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thumbnails', to='posts.Post')),
+            ],
+            options={
+                'unique_together': {('post', 'preset')},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from posts import search
+    search.rebuild(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in ('insert', 'delete', 'update'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS posts_post_fts_{trigger}')
+    schema_editor.execute('DROP TABLE IF EXISTS posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thumbnail',
+            name='format',
+            field=models.CharField(default='JPEG', max_length=8),
+        ),
+        migrations.AlterUniqueTogether(
+            name='thumbnail',
+            unique_together={('post', 'preset', 'width', 'format')},
+        ),
+    ]
@@ -22,12 +22,42 @@ class Post(models.Model):
         Group, blank=True, null=True,
         on_delete=models.SET_NULL, related_name='posts')
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Версия отрисованной карточки поста в кэше шаблонов
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    # Меняются только F()-выражениями, обычное сохранение их не перезаписывает
+    DENORMALIZED_FIELDS = ('comment_count', 'version')
 
     def __str__(self):
         return self.text
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Группа на момент загрузки: при переносе поста сбрасывается
+        # кэш и старой группы
+        instance.loaded_group_id = instance.__dict__.get('group_id')
+        instance.loaded_image = instance.__dict__.get('image')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DENORMALIZED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-pub_date']
+        # Ленты: главная, группы и профиля, порядок курсорной пагинации
+        indexes = [
+            models.Index(fields=['-pub_date', '-id']),
+            models.Index(fields=['group', '-pub_date', '-id']),
+            models.Index(fields=['author', '-pub_date', '-id']),
+        ]
 
 
 class Comment(models.Model):
@@ -45,6 +75,9 @@ class Comment(models.Model):
     def __str__(self):
         return self.text
 
+    class Meta:
+        indexes = [models.Index(fields=['post', 'created'])]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -56,3 +89,112 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ['user', 'author']
+        # Подписчики автора; (user, author) покрывает уникальность
+        indexes = [models.Index(fields=['author', 'user'])]
+
+
+class Thumbnail(models.Model):
+    """
+    Готовая миниатюра картинки поста: один вариант пресета по ширине и
+    формату для srcset. Создаётся фоновым пулом после сохранения поста,
+    шаблоны только читают готовые адреса.
+    """
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='thumbnails'
+    )
+    preset = models.CharField(max_length=32)
+    # Имя исходного файла: миниатюры от прежней картинки не показываются
+    source = models.CharField(max_length=100)
+    url = models.CharField(max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=8, default='JPEG')
+
+    class Meta:
+        unique_together = ['post', 'preset', 'width', 'format']
+
+
+class AuthorStats(models.Model):
+    """
+    Денормализованные счётчики пользователя для карточки автора.
+    Обновляются в одной транзакции с записью постов и подписок,
+    рассинхронизацию чинит команда recount_stats.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+
+class TrendingPost(models.Model):
+    """
+    Оценка активности поста с экспоненциальным затуханием: вклад поста
+    и каждого комментария к нему уменьшается вдвое за период
+    полураспада. Таблицу целиком пересчитывает команда rollup_trending,
+    в ней хранятся только лучшие TRENDING_POSTS_LIMIT постов.
+    """
+    post = models.OneToOneField(
+        Post, on_delete=models.CASCADE, primary_key=True,
+        related_name='trending'
+    )
+    group = models.ForeignKey(
+        Group, on_delete=models.CASCADE, blank=True, null=True,
+        related_name='+'
+    )
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-post']),
+            models.Index(fields=['group', '-score', '-post']),
+        ]
+
+
+class TrendingGroup(models.Model):
+    """Сумма оценок активности постов группы, см. TrendingPost."""
+    group = models.OneToOneField(
+        Group, on_delete=models.CASCADE, primary_key=True,
+        related_name='trending'
+    )
+    score = models.FloatField(db_index=True)
+
+
+class TimelineEntry(models.Model):
+    """
+    Материализованная лента подписок: строка на пару (подписчик, пост).
+    Заполняется при публикации поста (fan-out on write) и при подписке.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post']),
+            models.Index(fields=['user', 'author']),
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Позиция потокового импорта в исходном файле. Сохраняется в одной
+    транзакции с очередной пачкой строк, поэтому после сбоя импорт
+    продолжается ровно с первой незаписанной строки.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    position = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.source}: {self.position}'
@@ -0,0 +1,211 @@
+"""
+Курсорная (keyset) пагинация лент.
+
+Вместо COUNT(*) и OFFSET страница выбирается условием по ключу сортировки
+последней показанной записи, поэтому глубокие страницы стоят столько же,
+сколько первая. Ссылки вида ?page=N продолжают работать: такая страница
+выбирается через OFFSET, а дальше навигация идёт по курсорам.
+"""
+import base64
+import binascii
+import json
+from operator import attrgetter
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db import models
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def _reversed(ordering):
+    return [
+        name[1:] if name.startswith('-') else f'-{name}' for name in ordering
+    ]
+
+
+class CursorPaginator:
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id')):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+
+    def get_page(self, params):
+        """
+        Возвращает обычную django.core.paginator.Page (шаблоны и тесты
+        рассчитывают на этот тип) с дополнительными атрибутами
+        next_cursor и previous_cursor.
+        """
+        after = self.decode_cursor(params.get('after'))
+        before = self.decode_cursor(params.get('before'))
+        return self._page(*self._select(after, before, params))
+
+    def _select(self, after, before, params):
+        """Строки страницы (не больше per_page + 1) и флаги соседей."""
+        if after is not None:
+            items = self._fetch(self._keyset(after, forward=True))
+            has_next, has_previous = len(items) > self.per_page, True
+        elif before is not None:
+            items = self._fetch(
+                self._keyset(before, forward=False), reverse=True
+            )
+            has_next, has_previous = True, len(items) > self.per_page
+            items = items[:self.per_page][::-1]
+        else:
+            number = self._page_number(params.get('page'))
+            offset = (number - 1) * self.per_page
+            items = list(
+                self.object_list.order_by(*self.ordering)
+                [offset:offset + self.per_page + 1]
+            )
+            has_next, has_previous = len(items) > self.per_page, number > 1
+        return items, has_next, has_previous
+
+    def _page(self, items, has_next, has_previous):
+        items = items[:self.per_page]
+        page = Paginator(items, self.per_page).page(1)
+        page.next_cursor = (
+            self.encode_cursor(items[-1]) if has_next and items else None
+        )
+        page.previous_cursor = (
+            self.encode_cursor(items[0]) if has_previous and items else None
+        )
+        return page
+
+    def encode_cursor(self, obj):
+        values = []
+        for name in self._fields():
+            value = getattr(obj, name)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(value)
+        raw = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        """Разбирает курсор; испорченный курсор считается отсутствующим."""
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            values = json.loads(raw.decode())
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            return None
+        for index, name in enumerate(self._fields()):
+            if self._is_datetime(name):
+                if not isinstance(values[index], str):
+                    return None
+                values[index] = parse_datetime(values[index])
+                if values[index] is None:
+                    return None
+        return values
+
+    def _fields(self):
+        return [name.lstrip('-') for name in self.ordering]
+
+    def _is_datetime(self, name):
+        try:
+            field = self.object_list.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        return isinstance(field, models.DateTimeField)
+
+    def _keyset(self, values, forward, ordering=None):
+        """
+        Условие «строго после» (или «строго до») ключа values в порядке
+        self.ordering: a <= x AND ((a < x) OR (a = x AND b < y) OR ...).
+        Первое сравнение следует из остального условия, но без него
+        планировщик не видит диапазона по индексу и читает всю таблицу.
+        """
+        ordering = ordering or self.ordering
+        condition = Q()
+        equal = Q()
+        for name, value in zip(ordering, values):
+            field = name.lstrip('-')
+            descending = name.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        name, value = ordering[0], values[0]
+        lookup = 'lte' if name.startswith('-') == forward else 'gte'
+        return Q(**{f'{name.lstrip("-")}__{lookup}': value}) & condition
+
+    def _fetch(self, condition, reverse=False):
+        ordering = _reversed(self.ordering) if reverse else self.ordering
+        return list(
+            self.object_list.filter(condition)
+            .order_by(*ordering)[:self.per_page + 1]
+        )
+
+    @staticmethod
+    def _page_number(number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return 1
+        return max(number, 1)
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """
+    Курсорная пагинация по объединению нескольких источников, каждый из
+    которых упорядочен своим индексом: например, лента из TimelineEntry
+    и посты авторов без раскладки.
+
+    object_list — queryset, из которого загружаются объекты страницы;
+    sources — список (queryset, ordering, поле id объекта из object_list),
+    порядок источника поэлементно соответствует ordering пагинатора;
+    combined — вся лента одним queryset, по ней через OFFSET
+    обслуживаются ссылки ?page=N.
+
+    Каждый источник читает не больше per_page + 1 строк от курсора по
+    своему индексу; все источники выбираются одним запросом UNION ALL,
+    а объекты страницы — по первичному ключу. Сортировка общего списка
+    идёт в Python, поэтому база не сортирует во временном B-дереве.
+    """
+
+    def __init__(self, object_list, sources, combined, per_page,
+                 ordering=('-pub_date', '-id')):
+        super().__init__(object_list, per_page, ordering)
+        self.sources = sources
+        self.combined = combined
+
+    def _select(self, after, before, params):
+        if after is None and before is None and params.get('page'):
+            return CursorPaginator(
+                self.combined, self.per_page, self.ordering
+            )._select(after, before, params)
+        forward = before is None
+        cursor = after if forward else before
+        parts, values = [], []
+        for queryset, ordering, field in self.sources:
+            if cursor is not None:
+                queryset = queryset.filter(
+                    self._keyset(cursor, forward, ordering)
+                )
+            order = ordering if forward else _reversed(ordering)
+            sql, part_params = queryset.order_by(*order).values_list(
+                field
+            )[:self.per_page + 1].query.sql_with_params()
+            parts.append(f'SELECT * FROM ({sql})')
+            values.extend(part_params)
+        # Через extra, а не pk__in=RawSQL: в двойных скобках SQLite
+        # считает подзапрос скалярным и берёт из него одну строку
+        meta = self.object_list.model._meta
+        items = list(self.object_list.extra(
+            where=[
+                f'{meta.db_table}.{meta.pk.column} IN '
+                f'({" UNION ALL ".join(parts)})'
+            ],
+            params=values,
+        ).order_by())
+        for name in reversed(self.ordering):
+            items.sort(
+                key=attrgetter(name.lstrip('-')), reverse=name.startswith('-')
+            )
+        more = len(items) > self.per_page
+        if forward:
+            return items, more, cursor is not None
+        return items[-self.per_page:], True, more
@@ -0,0 +1,145 @@
+"""
+Полнотекстовый поиск по постам на SQLite FTS5.
+
+Индекс posts_post_fts хранит только токены текста (external content),
+синхронизацию с posts_post выполняют триггеры на вставку, изменение
+и удаление. Триггеры создаются после каждой миграции: SQLite пересоздаёт
+таблицу при изменении схемы, и триггеры при этом теряются.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+
+from .models import Group, Post, User
+
+FTS_TABLE = 'posts_post_fts'
+
+SETUP_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text, content='posts_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+]
+
+_words = re.compile(r'\w+')
+
+
+def is_supported(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def install(using=connection):
+    """Создаёт индекс и триггеры, если их ещё нет."""
+    if not is_supported(using):
+        return
+    with using.cursor() as cursor:
+        for sql in SETUP_SQL:
+            cursor.execute(sql)
+
+
+def rebuild(using=connection):
+    """Перестраивает индекс по текущему содержимому posts_post."""
+    install(using)
+    if is_supported(using):
+        with using.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+            )
+
+
+def match_expression(query):
+    """
+    Превращает пользовательский ввод в запрос FTS5: каждое слово
+    берётся в кавычки, поэтому синтаксис FTS5 во вводе не работает.
+    Слова ищутся по префиксу: стеммера для русского в FTS5 нет,
+    и «пирог» должен находить «пирога».
+    """
+    return ' '.join(f'"{word}"*' for word in _words.findall(query))
+
+
+def filter_matching(queryset, query):
+    """
+    Оставляет в queryset постов подходящие под запрос. Подзапрос
+    вставляется через extra: обёрнутый в RawSQL, он попал бы в IN
+    в двойных скобках, и SQLite взял бы из него только первую строку.
+    """
+    return queryset.extra(
+        where=[
+            f'{Post._meta.db_table}.id IN '
+            f'(SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)'
+        ],
+        params=[match_expression(query)],
+    )
+
+
+def search_posts(query, queryset=None):
+    """
+    Посты, подходящие под запрос, с релевантностью в поле rank
+    (bm25: чем меньше, тем выше пост в выдаче).
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    if not is_supported(connection):
+        return queryset.filter(text__icontains=query).annotate(
+            rank=RawSQL('0', ())
+        )
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = posts_post.id',
+            f'{FTS_TABLE} MATCH %s',
+        ],
+        params=[expression],
+    ).annotate(rank=RawSQL(f'{FTS_TABLE}.rank', ()))
+
+
+def search_authors(query, limit=5):
+    """Авторы по началу имени, сначала самые читаемые."""
+    query = query.strip()
+    if not query:
+        return User.objects.none()
+    return User.objects.filter(
+        Q(username__istartswith=query) | Q(last_name__istartswith=query)
+    ).select_related('stats').order_by('-stats__followers_count')[:limit]
+
+
+def search_groups(query, limit=5):
+    """Группы по вхождению в название, сначала совпадающие с начала."""
+    query = query.strip()
+    if not query:
+        return Group.objects.none()
+    return Group.objects.filter(title__icontains=query).annotate(
+        prefix=Case(
+            When(title__istartswith=query, then=0),
+            default=1,
+            output_field=IntegerField(),
+        )
+    ).order_by('prefix', 'title')[:limit]
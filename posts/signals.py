@@ -0,0 +1,79 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import counters, feed_cache, follow_graph, thumbnails, timeline
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_stats(instance.author_id, 1, 'posts_count')
+        timeline.fanout_post(instance)
+    else:
+        counters.bump_version(Post.objects.filter(pk=instance.pk))
+    feed_cache.bump_post(
+        instance, [getattr(instance, 'loaded_group_id', None)]
+    )
+    if instance.image and (
+        instance.image.name != getattr(instance, 'loaded_image', None)
+    ):
+        thumbnails.schedule(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change_stats(instance.author_id, -1, 'posts_count')
+    feed_cache.bump_post(instance)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if not created:
+        counters.bump_version(instance.posts.all())
+        feed_cache.bump(feed_cache.ALL)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comment_count(instance.post_id, 1)
+        feed_cache.bump_post(instance.post)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_comment_count(instance.post_id, -1)
+    feed_cache.bump_post(instance.post)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_stats(instance.author_id, 1, 'followers_count')
+        counters.change_stats(instance.user_id, 1, 'following_count')
+        timeline.backfill(instance.user_id, instance.author_id)
+        follow_graph.record(instance.user_id, instance.author_id, True)
+        feed_cache.bump(
+            feed_cache.profile_feed(instance.author.username),
+            feed_cache.profile_feed(instance.user.username),
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_stats(instance.author_id, -1, 'followers_count')
+    counters.change_stats(instance.user_id, -1, 'following_count')
+    timeline.trim(instance.user_id, instance.author_id)
+    timeline.lost_follower(instance.author_id)
+    follow_graph.record(instance.user_id, instance.author_id, False)
+    feed_cache.bump(
+        feed_cache.profile_feed(instance.author.username),
+        feed_cache.profile_feed(instance.user.username),
+    )
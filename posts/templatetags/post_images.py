@@ -0,0 +1,11 @@
+from django import template
+
+from posts.thumbnails import ready_picture
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_picture(post, preset):
+    """Варианты миниатюры для <picture> и srcset; None, пока не построены."""
+    return ready_picture(post, preset)
@@ -0,0 +1,188 @@
+"""
+Заблаговременная генерация миниатюр картинок постов.
+
+После сохранения поста с картинкой миниатюры всех пресетов из
+POST_THUMBNAIL_PRESETS строятся в пуле потоков, а не при первом показе
+поста. Пока миниатюры нет, шаблон выводит заглушку; готовая миниатюра
+сбрасывает кэш карточки и лент.
+
+Каждый пресет строится в нескольких вариантах для srcset: ширины
+POST_THUMBNAIL_WIDTHS (не шире исходной картинки) с пропорциями пресета
+в каждом формате POST_THUMBNAIL_FORMATS. Вариант ширины самого пресета
+в первом формате строится всегда и служит запасным src.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import prefetch_related_objects
+from sorl.thumbnail import get_thumbnail
+
+from . import counters, feed_cache
+from .models import Post, Thumbnail
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+CONTENT_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+
+def presets():
+    return getattr(settings, 'POST_THUMBNAIL_PRESETS', {})
+
+
+def formats():
+    return getattr(settings, 'POST_THUMBNAIL_FORMATS', ('JPEG',))
+
+
+def variants(geometry, source_width):
+    """Пары (ширина, геометрия) вариантов пресета для картинки."""
+    base_width, base_height = map(int, geometry.split('x'))
+    widths = {
+        width for width in getattr(settings, 'POST_THUMBNAIL_WIDTHS', ())
+        if width <= source_width
+    } | {base_width}
+    return [
+        (width, f'{width}x{round(width * base_height / base_width)}')
+        for width in sorted(widths)
+    ]
+
+
+def prefetch(posts):
+    """Подгружает миниатюры одним запросом, только для постов с картинкой."""
+    with_image = [post for post in posts if post.image]
+    if with_image:
+        prefetch_related_objects(with_image, 'thumbnails')
+
+
+def ready_picture(post, preset):
+    """
+    Готовые варианты пресета для <picture>: img — запасной вариант,
+    srcset — варианты его формата, sources — остальные форматы.
+    None, пока запасной вариант не построен.
+    """
+    if not post.image or preset not in presets():
+        return None
+    base_width = int(presets()[preset][0].split('x')[0])
+    by_format = {}
+    for thumbnail in post.thumbnails.all():
+        if thumbnail.preset == preset and thumbnail.source == post.image.name:
+            by_format.setdefault(thumbnail.format, []).append(thumbnail)
+    fallback_format = formats()[0]
+    img = next((
+        thumbnail for thumbnail in by_format.get(fallback_format, ())
+        if thumbnail.width == base_width
+    ), None)
+    if img is None:
+        return None
+
+    def srcset(thumbnails):
+        return ', '.join(
+            f'{thumbnail.url} {thumbnail.width}w'
+            for thumbnail in sorted(thumbnails, key=lambda t: t.width)
+        )
+
+    return {
+        'img': img,
+        'srcset': srcset(by_format[fallback_format]),
+        'sources': [
+            {'type': CONTENT_TYPES[format], 'srcset': srcset(thumbnails)}
+            for format, thumbnails in by_format.items()
+            if format != fallback_format and format in formats()
+        ],
+    }
+
+
+def generate(post_id):
+    """Строит недостающие варианты миниатюр поста; возвращает число новых."""
+    post = Post.objects.select_related('author', 'group').filter(
+        pk=post_id
+    ).first()
+    if post is None:
+        return 0
+    if not post.image:
+        Thumbnail.objects.filter(post=post).delete()
+        return 0
+    # Варианты прежней картинки больше не нужны
+    Thumbnail.objects.filter(post=post).exclude(
+        source=post.image.name
+    ).delete()
+    ready = set(
+        Thumbnail.objects.filter(post=post).values_list(
+            'preset', 'width', 'format'
+        )
+    )
+    created = 0
+    for preset, (geometry, options) in presets().items():
+        for width, variant_geometry in variants(geometry, post.image.width):
+            for format in formats():
+                if (preset, width, format) in ready:
+                    continue
+                image = get_thumbnail(
+                    post.image, variant_geometry, format=format, **options
+                )
+                if not image.exists():
+                    logger.warning(
+                        'Не удалось построить миниатюру %s %s %s '
+                        'для поста %s', preset, width, format, post_id,
+                    )
+                    continue
+                Thumbnail.objects.update_or_create(
+                    post=post, preset=preset, width=width, format=format,
+                    defaults={
+                        'source': post.image.name,
+                        'url': image.url,
+                        'height': image.height,
+                    },
+                )
+                created += 1
+    if created:
+        counters.bump_version(Post.objects.filter(pk=post_id))
+        feed_cache.bump_post(post)
+    return created
+
+
+def schedule(post):
+    """Ставит генерацию миниатюр в очередь после коммита транзакции."""
+    post_id = post.pk
+    transaction.on_commit(lambda: _submit(post_id))
+
+
+def _in_memory_db():
+    """
+    База SQLite в памяти (тесты): запись из потока пула упирается в
+    табличные блокировки общего кэша, которые не ждут busy_timeout,
+    поэтому миниатюры строятся в потоке запроса.
+    """
+    return connection.vendor == 'sqlite' and connection.is_in_memory_db()
+
+
+def _submit(post_id):
+    global _executor
+    workers = getattr(settings, 'POST_THUMBNAIL_WORKERS', 2)
+    if not workers or _in_memory_db():
+        _generate_logged(post_id)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='thumbnails'
+        )
+    _executor.submit(_generate_in_worker, post_id)
+
+
+def _generate_logged(post_id):
+    """Ошибка миниатюры не должна ронять сохранение поста."""
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception('Ошибка генерации миниатюр поста %s', post_id)
+
+
+def _generate_in_worker(post_id):
+    try:
+        _generate_logged(post_id)
+    finally:
+        connection.close()
@@ -0,0 +1,194 @@
+"""
+Лента подписок, материализованная в таблице TimelineEntry.
+
+Новый пост раскладывается по лентам подписчиков автора в момент
+публикации (fan-out on write). Для авторов, у которых подписчиков больше
+TIMELINE_FANOUT_LIMIT, раскладка не делается: их посты подмешиваются
+в ленту при чтении (fan-out on read). Когда автор опускается до порога,
+ленты его подписчиков дополняются постами, написанными без раскладки.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .paginator import CursorPaginator, MergedCursorPaginator
+
+BATCH_SIZE = 500
+
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 1000)
+
+
+def backfill_limit():
+    return getattr(settings, 'TIMELINE_BACKFILL_LIMIT', 500)
+
+
+def is_celebrity(author_id):
+    return AuthorStats.objects.filter(
+        user_id=author_id, followers_count__gt=fanout_limit()
+    ).exists()
+
+
+def celebrity_ids(user):
+    """Авторы из подписок пользователя, чьи посты читаются без раскладки."""
+    return list(
+        AuthorStats.objects.filter(
+            user__following__user=user,
+            followers_count__gt=fanout_limit(),
+        ).values_list('user_id', flat=True)
+    )
+
+
+def fanout_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    entries = [
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers
+    ]
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту свежие посты автора после подписки на него."""
+    if is_celebrity(author_id):
+        return
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .values_list('id', 'pub_date')[:backfill_limit()]
+    )
+    entries = [
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for post_id, pub_date in posts
+    ]
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def trim(user_id, author_id):
+    """Убирает посты автора из ленты после отписки."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def lost_follower(author_id):
+    """
+    Вызывается после отписки. Если автор опустился до порога раскладки,
+    его свежие посты заново раскладываются по лентам всех подписчиков:
+    посты, опубликованные без раскладки, иначе пропали бы из лент.
+    При переходе порога вверх ничего делать не нужно: строки, которые
+    остались в лентах, при чтении сливаются с постами автора.
+    """
+    if not AuthorStats.objects.filter(
+        user_id=author_id, followers_count=fanout_limit()
+    ).exists():
+        return
+    TimelineEntry.objects.filter(author_id=author_id).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {TimelineEntry._meta.db_table}
+                (user_id, post_id, author_id, pub_date)
+            SELECT follow.user_id, post.id, post.author_id, post.pub_date
+            FROM {Follow._meta.db_table} follow
+            JOIN (
+                SELECT id, author_id, pub_date
+                FROM {Post._meta.db_table}
+                WHERE author_id = %s
+                ORDER BY pub_date DESC
+                LIMIT %s
+            ) post ON post.author_id = follow.author_id
+            """,
+            [author_id, backfill_limit()],
+        )
+
+
+def rebuild(user_id):
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    authors = Follow.objects.filter(
+        user_id=user_id
+    ).values_list('author_id', flat=True)
+    for author_id in authors:
+        backfill(user_id, author_id)
+
+
+def rebuild_all():
+    """
+    Перестраивает ленты всех подписчиков одним INSERT ... SELECT:
+    то же, что rebuild для каждого, но без запросов на каждую подписку.
+    Опирается на AuthorStats, поэтому вызывается после recount.
+    """
+    TimelineEntry.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {TimelineEntry._meta.db_table}
+                (user_id, post_id, author_id, pub_date)
+            SELECT follow.user_id, post.id, post.author_id, post.pub_date
+            FROM {Follow._meta.db_table} follow
+            LEFT JOIN {AuthorStats._meta.db_table} stats
+                ON stats.user_id = follow.author_id
+            JOIN (
+                SELECT id, author_id, pub_date, ROW_NUMBER() OVER (
+                    PARTITION BY author_id ORDER BY pub_date DESC
+                ) AS position
+                FROM {Post._meta.db_table}
+            ) post ON post.author_id = follow.author_id
+            WHERE COALESCE(stats.followers_count, 0) <= %s
+                AND post.position <= %s
+            ORDER BY follow.user_id, post.pub_date DESC
+            """,
+            [fanout_limit(), backfill_limit()],
+        )
+
+
+def get_feed_page(user, params, per_page):
+    """
+    Страница ленты пользователя. Обычно это чтение диапазона индекса
+    (user, -pub_date) в TimelineEntry; если пользователь подписан на
+    авторов без раскладки, к нему добавляется чтение индекса
+    (author, -pub_date) каждого такого автора, и страница собирается
+    слиянием этих источников.
+    """
+    celebrities = celebrity_ids(user)
+    if celebrities:
+        entries = TimelineEntry.objects.filter(user=user)
+        posts = Post.objects.select_related('author', 'group')
+        sources = [(entries, ('-pub_date', '-post_id'), 'post_id')] + [
+            (Post.objects.filter(author_id=author_id),
+             ('-pub_date', '-id'), 'id')
+            for author_id in celebrities
+        ]
+        combined = posts.filter(
+            Q(id__in=entries.values('post_id'))
+            | Q(author_id__in=celebrities)
+        )
+        paginator = MergedCursorPaginator(
+            posts, sources, combined, per_page
+        )
+        return paginator.get_page(params)
+    entries = TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    )
+    paginator = CursorPaginator(entries, per_page, ('-pub_date', '-post_id'))
+    page = paginator.get_page(params)
+    page.object_list = [entry.post for entry in page.object_list]
+    return page
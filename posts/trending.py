@@ -0,0 +1,178 @@
+"""
+Популярные посты и группы по активности с затуханием.
+
+Событиями считаются публикация поста и комментарии к нему. Вклад события
+равен его весу, умноженному на 2^(-возраст / TRENDING_HALF_LIFE), оценка
+поста — сумма вкладов его событий, оценка группы — сумма оценок её
+постов. События старше TRENDING_WINDOW периодов полураспада почти ничего
+не добавляют и не читаются.
+
+rollup() читает события одним проходом по каждой таблице сразу в массивы
+NumPy, складывает вклады через bincount и целиком заменяет таблицы
+TrendingPost и TrendingGroup. Вьюхи популярного читают только их.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import feed_cache
+from .models import Comment, Group, Post, TrendingGroup, TrendingPost
+
+POST_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+FETCH_SIZE = 100_000
+
+
+def half_life():
+    return getattr(settings, 'TRENDING_HALF_LIFE', 6 * 60 * 60)
+
+
+def window():
+    return getattr(settings, 'TRENDING_WINDOW', 10)
+
+
+def posts_limit():
+    return getattr(settings, 'TRENDING_POSTS_LIMIT', 1000)
+
+
+def _fetch(sql, params):
+    """Строки запроса из трёх чисел как массив float64 формы (n, 3)."""
+    chunks = []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.float64))
+    if not chunks:
+        return np.empty((0, 3))
+    return np.concatenate(chunks)
+
+
+def _fetch_python(rows, now):
+    """То же для баз без julianday: возраст считается в Python."""
+    return np.array(
+        [
+            (post_id, group_id or 0, (now - created).total_seconds())
+            for post_id, group_id, created in rows
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 3)
+
+
+def events(now, since):
+    """
+    Массивы post_id, group_id (0 — без группы), возраст в секундах
+    и вес для всех событий после since.
+    """
+    if connection.vendor == 'sqlite':
+        # Даты в SQLite хранятся текстом, и разбирать их в Python
+        # дольше, чем считать сам рейтинг
+        now_value = connection.ops.adapt_datetimefield_value(now)
+        since_value = connection.ops.adapt_datetimefield_value(since)
+        posts = _fetch(
+            f"""
+            SELECT id, COALESCE(group_id, 0),
+                (julianday(%s) - julianday(pub_date)) * 86400.0
+            FROM {Post._meta.db_table}
+            WHERE pub_date >= %s
+            """,
+            [now_value, since_value],
+        )
+        comments = _fetch(
+            f"""
+            SELECT comment.post_id, COALESCE(post.group_id, 0),
+                (julianday(%s) - julianday(comment.created)) * 86400.0
+            FROM {Comment._meta.db_table} comment
+            JOIN {Post._meta.db_table} post ON post.id = comment.post_id
+            WHERE comment.created >= %s
+            """,
+            [now_value, since_value],
+        )
+    else:
+        posts = _fetch_python(
+            Post.objects.filter(pub_date__gte=since).values_list(
+                'id', 'group_id', 'pub_date'
+            ).iterator(chunk_size=FETCH_SIZE),
+            now,
+        )
+        comments = _fetch_python(
+            Comment.objects.filter(created__gte=since).values_list(
+                'post_id', 'post__group_id', 'created'
+            ).iterator(chunk_size=FETCH_SIZE),
+            now,
+        )
+    rows = np.concatenate([posts, comments])
+    weights = np.concatenate([
+        np.full(len(posts), POST_WEIGHT),
+        np.full(len(comments), COMMENT_WEIGHT),
+    ])
+    return (
+        rows[:, 0].astype(np.int64), rows[:, 1].astype(np.int64),
+        rows[:, 2], weights,
+    )
+
+
+def scores(post_ids, group_ids, ages, weights, half_life):
+    """
+    Оценки постов и групп: (post_ids, их group_ids, оценки постов,
+    id групп, оценки групп). Посты отсортированы по убыванию оценки.
+    """
+    contributions = weights * np.exp2(-np.maximum(ages, 0) / half_life)
+    posts, inverse = np.unique(post_ids, return_inverse=True)
+    post_scores = np.bincount(inverse, weights=contributions)
+    post_groups = np.zeros(len(posts), dtype=np.int64)
+    post_groups[inverse] = group_ids
+    order = np.lexsort((-posts, -post_scores))
+    grouped = group_ids > 0
+    groups, inverse = np.unique(group_ids[grouped], return_inverse=True)
+    group_scores = np.bincount(inverse, weights=contributions[grouped])
+    return (
+        posts[order], post_groups[order], post_scores[order],
+        groups, group_scores,
+    )
+
+
+def rollup(now=None):
+    """Пересчитывает таблицы популярного; возвращает число строк."""
+    now = now or timezone.now()
+    since = now - timedelta(seconds=half_life() * window())
+    posts, post_groups, post_scores, groups, group_scores = scores(
+        *events(now, since), half_life()
+    )
+    limit = posts_limit()
+    with transaction.atomic():
+        # Посты и группы, удалённые после чтения событий, пропускаются
+        existing_posts = set(Post.objects.filter(
+            pk__in=posts[:limit].tolist()
+        ).values_list('pk', flat=True))
+        existing_groups = set(Group.objects.filter(
+            pk__in=groups.tolist()
+        ).values_list('pk', flat=True))
+        trending_posts = [
+            TrendingPost(
+                post_id=post_id,
+                group_id=group_id if group_id in existing_groups else None,
+                score=score,
+            )
+            for post_id, group_id, score in zip(
+                posts[:limit].tolist(), post_groups[:limit].tolist(),
+                post_scores[:limit].tolist(),
+            )
+            if post_id in existing_posts
+        ]
+        trending_groups = [
+            TrendingGroup(group_id=group_id, score=score)
+            for group_id, score in zip(groups.tolist(), group_scores.tolist())
+            if group_id in existing_groups
+        ]
+        TrendingPost.objects.all().delete()
+        TrendingPost.objects.bulk_create(trending_posts, batch_size=500)
+        TrendingGroup.objects.all().delete()
+        TrendingGroup.objects.bulk_create(trending_groups, batch_size=500)
+    feed_cache.bump(feed_cache.trending_feed())
+    return {'posts': len(trending_posts), 'groups': len(trending_groups)}
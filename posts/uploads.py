@@ -0,0 +1,139 @@
+"""
+Приём картинок постов.
+
+Во вьюхах с декоратором limited_uploads загрузка пишется во временный
+файл на диске, а не в память, и обрывается, как только превышен
+POST_IMAGE_MAX_BYTES: остаток запроса читается, но не сохраняется. Форма
+видит такой файл как слишком большой. Остальные вьюхи принимают файлы
+обработчиками по умолчанию.
+
+Принятая картинка нормализуется до сохранения: размеры проверяются по
+заголовку ещё до декодирования, поворот из EXIF применяется к пикселям,
+метаданные (EXIF, GPS, ICC) отбрасываются, а длинная сторона
+уменьшается до POST_IMAGE_MAX_EDGE. Хранимый оригинал и стоимость его
+декодирования при построении миниатюр так ограничены сверху.
+"""
+import os
+from functools import wraps
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import (
+    SimpleUploadedFile, TemporaryUploadedFile,
+)
+from django.core.files.uploadhandler import (
+    FileUploadHandler, StopFutureHandlers,
+)
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+
+def max_bytes():
+    return getattr(settings, 'POST_IMAGE_MAX_BYTES', 20 * 1024 * 1024)
+
+
+def max_pixels():
+    return getattr(settings, 'POST_IMAGE_MAX_PIXELS', 50_000_000)
+
+
+def max_edge():
+    return getattr(settings, 'POST_IMAGE_MAX_EDGE', 2048)
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """
+    Как TemporaryFileUploadHandler, но перестаёт писать файл после
+    max_bytes() байт и помечает его атрибутом oversized.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = TemporaryUploadedFile(
+            self.file_name, self.content_type, 0, self.charset,
+            self.content_type_extra,
+        )
+        self.file.oversized = False
+        self.received = 0
+        # Обработчики по умолчанию после этого файл не получают
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > max_bytes():
+            self.file.oversized = True
+            return None
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = min(file_size, max_bytes())
+        return self.file
+
+
+def limited_uploads(view):
+    """
+    Принимает файлы вьюхи через LimitedUploadHandler. Обработчики можно
+    менять, только пока request.POST не прочитан, а CsrfViewMiddleware
+    читает его до вьюхи, поэтому CSRF проверяется здесь, после замены.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers.insert(0, LimitedUploadHandler(request))
+        return protected(request, *args, **kwargs)
+    return wrapper
+
+
+def check_size(upload):
+    if getattr(upload, 'oversized', False):
+        raise ValidationError(
+            'Файл больше %(limit)s.', code='file_too_large',
+            params={'limit': filesizeformat(max_bytes())},
+        )
+
+
+def normalize(upload):
+    """
+    Новый файл для сохранения вместо загруженного: JPEG, или PNG для
+    картинок с прозрачностью, без метаданных и не больше max_edge().
+    """
+    upload.seek(0)
+    with Image.open(upload) as image:
+        width, height = image.size
+        if width * height > max_pixels():
+            raise ValidationError(
+                'Картинка больше %(limit)s Мп.',
+                code='too_many_pixels',
+                params={'limit': f'{max_pixels() / 1_000_000:g}'},
+            )
+        edge = max_edge()
+        scale = min(edge / max(width, height), 1)
+        # Большой JPEG декодируется сразу в уменьшенном в 2^n раз масштабе,
+        # не меньше итогового размера
+        image.draft('RGB', (int(width * scale), int(height * scale)))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        transparent = image.mode in ('RGBA', 'LA', 'PA') or (
+            image.mode == 'P' and 'transparency' in image.info
+        )
+        output = BytesIO()
+        if transparent:
+            image.convert('RGBA').save(output, 'PNG', optimize=True)
+            extension, content_type = 'png', 'image/png'
+        else:
+            image.convert('RGB').save(
+                output, 'JPEG', quality=getattr(
+                    settings, 'POST_IMAGE_QUALITY', 85
+                ),
+                optimize=True, progressive=True,
+            )
+            extension, content_type = 'jpg', 'image/jpeg'
+    name = os.path.splitext(os.path.basename(upload.name))[0] or 'image'
+    return SimpleUploadedFile(
+        f'{name}.{extension}', output.getvalue(), content_type
+    )
@@ -4,9 +4,19 @@ from . import views
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('trending/', views.trending, name='trending'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
+    path(
+        'group/<slug:slug>/trending/',
+        views.group_trending, name='group_trending'
+    ),
+    path(
+        'group/<slug:slug>/export/',
+        views.group_export, name='group_export'
+    ),
     path('new/', views.new_post, name='new_post'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search, name='search'),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
     path(
@@ -25,4 +35,8 @@ urlpatterns = [
         '<str:username>/unfollow/',
         views.profile_unfollow, name='profile_unfollow'
     ),
+    path(
+        '<str:username>/export/',
+        views.profile_export, name='profile_export'
+    ),
 ]
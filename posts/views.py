@@ -1,51 +1,132 @@
-from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import F
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from django.views.decorators.cache import cache_page
 
-from .models import Post, Group, User, Comment, Follow
+from core.queries import query_budget
+from core.ratelimit import rate_limit
+from core.replicas import read_replica
+
+from . import (
+    counters, exporter, feed_cache, follow_graph, search as post_search,
+    thumbnails, timeline, write_queue,
+)
+from .models import Post, Group, User, Comment, Follow, TrendingGroup
 from .forms import PostForm, CommentForm
+from .paginator import CursorPaginator
+from .uploads import limited_uploads
 
 
-@cache_page(1 * 20)
+@query_budget(4)
+@read_replica
+@feed_cache.cache_feed(feed_cache.index_feed)
 def index(request):
-    post_list = Post.objects.select_related('group').all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.select_related('author', 'group').all()
+    page = CursorPaginator(post_list, 10).get_page(request.GET)
+    thumbnails.prefetch(page)
     return render(
         request,
         'index.html',
-        {'page': page, 'paginator': paginator}
+        {'page': page, 'paginator': page.paginator}
     )
 
 
+@query_budget(5)
+@read_replica
+@feed_cache.cache_feed(feed_cache.group_feed)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()[:12]
-    paginator = Paginator(posts, 5)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = group.posts.select_related('author')
+    page = CursorPaginator(posts, 5).get_page(request.GET)
+    thumbnails.prefetch(page)
     return render(
         request,
         'group.html',
         {
             'group': group,
-            'posts': posts,
-            'paginator': paginator,
+            'paginator': page.paginator,
             'page': page
         }
     )
 
 
+@query_budget(5)
+@read_replica
+@feed_cache.cache_feed(feed_cache.trending_feed)
+def trending(request):
+    posts = Post.objects.select_related('author', 'group').annotate(
+        score=F('trending__score')
+    ).filter(trending__isnull=False)
+    page = CursorPaginator(
+        posts, 10, ordering=('-score', '-id')
+    ).get_page(request.GET)
+    thumbnails.prefetch(page)
+    groups = TrendingGroup.objects.select_related('group').order_by(
+        '-score'
+    )[:10]
+    return render(
+        request,
+        'trending.html',
+        {'page': page, 'paginator': page.paginator, 'groups': groups}
+    )
+
+
+@query_budget(5)
+@read_replica
+@feed_cache.cache_feed(feed_cache.trending_feed)
+def group_trending(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    posts = Post.objects.select_related('author').annotate(
+        score=F('trending__score')
+    ).filter(trending__group=group)
+    page = CursorPaginator(
+        posts, 5, ordering=('-score', '-id')
+    ).get_page(request.GET)
+    thumbnails.prefetch(page)
+    return render(
+        request,
+        'group.html',
+        {
+            'group': group,
+            'paginator': page.paginator,
+            'page': page,
+            'trending': True,
+        }
+    )
+
+
+@query_budget(6)
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts = post_search.search_posts(query).select_related('author', 'group')
+    paginator = CursorPaginator(posts, 10, ordering=('rank', 'id'))
+    page = paginator.get_page(request.GET)
+    thumbnails.prefetch(page)
+    first_page = 'after' not in request.GET and 'before' not in request.GET
+    context = {
+        'query': query,
+        'page': page,
+        'paginator': page.paginator,
+        'authors': post_search.search_authors(query) if first_page else [],
+        'groups': post_search.search_groups(query) if first_page else [],
+    }
+    return render(request, 'search.html', context)
+
+
+@query_budget(9)
 @login_required
+@rate_limit('post', methods=('POST',))
+@limited_uploads
 def new_post(request):
     if request.method == 'POST':
         form = PostForm(request.POST, files=request.FILES)
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
-            post.save()
+            with transaction.atomic():
+                post.save()
             return redirect('index')
         return render(request, 'new_post.html', {'form': form,
                                                  'msg': 'Новый пост'})
@@ -54,38 +135,59 @@ def new_post(request):
                                              'msg': 'Новый пост'})
 
 
+@query_budget(6)
+@read_replica
+@feed_cache.cache_feed(feed_cache.profile_feed)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    paginator = Paginator(post_list, 5)
-    page_number = request.GET.get('page')
-    count = paginator.count
-    page = paginator.get_page(page_number)
-    if request.user.is_authenticated:
-        following = (
-            Follow.objects.filter(
-                user=request.user,
-                author=User.objects.get(username=username)).all()
-        )
-    else:
-        following = False
+    author = get_object_or_404(
+        counters.author_cards(request.user), username=username
+    )
+    write_queue.pending(request.user).apply_to_card(author)
+    posts = author.posts.select_related('group')
+    page = CursorPaginator(posts, 5).get_page(request.GET)
+    thumbnails.prefetch(page)
     context = {
         'page': page,
-        'paginator': paginator,
+        'paginator': page.paginator,
         'author': author,
-        'count': count,
-        'following': following,
+        'following': author.is_followed,
+        'suggestions': (
+            suggested_authors(author) if request.user == author else []
+        ),
     }
     return render(request, 'profile.html', context)
 
 
+def suggested_authors(user, limit=5):
+    """Кого читать: авторы из подписок тех, на кого подписан user."""
+    ids = follow_graph.get().suggestions(user.pk, limit)
+    if not ids:
+        return []
+    users = User.objects.in_bulk(ids)
+    return [users[pk] for pk in ids if pk in users]
+
+
+@query_budget(6)
+@read_replica
 def post_view(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    post = get_object_or_404(Post, pk=post_id)
-    comments = Comment.objects.filter(post=post_id)
+    author = get_object_or_404(
+        counters.author_cards(request.user), username=username
+    )
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id
+    )
+    thumbnails.prefetch([post])
+    comments = Comment.objects.filter(
+        post=post_id
+    ).select_related('author').order_by('created')
+    pending = write_queue.pending(request.user)
+    if pending:
+        pending.apply_to_card(author)
+        comments = [*comments, *pending.comments_for(post)]
     form = CommentForm()
     context = {
         'author': author,
+        'following': author.is_followed,
         'post': post,
         'form': form,
         'comments': comments,
@@ -93,11 +195,13 @@ def post_view(request, username, post_id):
     return render(request, 'post.html', context)
 
 
+@query_budget(6)
 @login_required()
+@limited_uploads
 def post_edit(request, username, post_id):
     user = request.user
-    post = get_object_or_404(Post, id=post_id)
-    if user != post.author:
+    post = get_object_or_404(Post.objects.select_related('author'), id=post_id)
+    if user.id != post.author_id:
         return redirect('post', username=username, post_id=post_id)
     form = (
         PostForm(
@@ -125,44 +229,88 @@ def server_error(request):
     return render(request, "misc/500.html", status=500)
 
 
+@query_budget(5)
 @login_required()
+@rate_limit('comment')
 def add_comment(request, username, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
     if request.method == 'POST':
         form = CommentForm(request.POST)
         if form.is_valid():
             comment = form.save(commit=False)
             comment.author = request.user
             comment.post = post
-            comment.save()
+            write_queue.save_comment(comment)
             return redirect('post', username=username, post_id=post_id)
     return redirect('post', username=post.author.username, post_id=post_id)
 
 
+@query_budget(5)
+@read_replica
 @login_required()
 def follow_index(request):
-    following = Follow.objects.filter(user=request.user).all()
-    post_list = Post.objects.filter(author__following__in=following)
-    paginator = Paginator(post_list, 5)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page = timeline.get_feed_page(request.user, request.GET, 5)
+    thumbnails.prefetch(page)
     context = {
         'page': page,
-        'paginator': paginator,
+        'paginator': page.paginator,
     }
     return render(request, 'follow.html', context)
 
 
+@query_budget(10)
 @login_required
+@rate_limit('follow')
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        write_queue.follow(request.user, author)
     return redirect('profile', username=username)
 
 
+@query_budget(9)
 @login_required
+@rate_limit('follow')
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=author).delete()
+    write_queue.cancel_follow(request.user, author)
+    # Удаление по одной записи с уже загруженными user и author:
+    # обработчик post_delete не перечитывает их из базы
+    for follow in Follow.objects.filter(user=request.user, author=author):
+        follow.user, follow.author = request.user, author
+        follow.delete()
     return redirect('profile', username)
+
+
+def export_response(posts, request, filename):
+    export_format = request.GET.get('format', 'jsonl')
+    if export_format not in exporter.FORMATS:
+        raise Http404
+    render_lines, content_type = exporter.FORMATS[export_format]
+    response = StreamingHttpResponse(
+        render_lines(exporter.iter_posts(posts)), content_type=content_type
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{filename}.{export_format}"'
+    )
+    return response
+
+
+@query_budget(3)
+@login_required
+def profile_export(request, username):
+    author = get_object_or_404(User, username=username)
+    if request.user != author and not request.user.is_staff:
+        raise PermissionDenied
+    return export_response(author.posts.all(), request, username)
+
+
+@query_budget(3)
+@login_required
+def group_export(request, slug):
+    if not request.user.is_staff:
+        raise PermissionDenied
+    group = get_object_or_404(Group, slug=slug)
+    return export_response(group.posts.all(), request, slug)
@@ -0,0 +1,351 @@
+"""
+Пакетная запись комментариев и подписок.
+
+Если WRITE_QUEUE_INTERVAL больше нуля, add_comment и profile_follow не
+пишут в базу сами, а ставят объект в очередь процесса. Фоновый поток раз
+в WRITE_QUEUE_INTERVAL миллисекунд, или как только набралось
+WRITE_QUEUE_BATCH объектов, записывает всю очередь через bulk_create
+одной транзакцией: один коммит и одна блокировка на запись вместо
+отдельной транзакции на каждый запрос. Сигналы post_save отправляются
+для каждого объекта в той же транзакции, поэтому счётчики, ленты и кэш
+обновляются как при обычном сохранении.
+
+Пока объект ждёт в очереди, автор видит свою запись: она лежит в общем
+кэше (overlay) не дольше WRITE_QUEUE_OVERLAY_SECONDS, вьюхи подмешивают
+её к прочитанному из базы, а закэшированные страницы лент ему не
+отдаются, пока не истечёт его последняя запись в overlay.
+
+Очередь живёт в памяти процесса: при аварийном завершении процесса
+незаписанные объекты теряются, при обычном — дописываются. Отписка
+оставляет в общем кэше метку, и подписки, поставленные в очередь до неё
+в любом процессе, не записываются.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import AuthorStats, Comment, Follow
+
+logger = logging.getLogger('posts.write_queue')
+
+# С запасом дольше, чем подписка может ждать записи
+CANCEL_SECONDS = 60 * 60
+
+
+def interval():
+    """Пауза между записями в миллисекундах; 0 — очередь выключена."""
+    return getattr(settings, 'WRITE_QUEUE_INTERVAL', 0)
+
+
+def batch_size():
+    return getattr(settings, 'WRITE_QUEUE_BATCH', 200)
+
+
+def overlay_seconds():
+    return getattr(settings, 'WRITE_QUEUE_OVERLAY_SECONDS', 10)
+
+
+def overlay_key(user_id):
+    """Счётчик слотов overlay пользователя, см. _remember."""
+    return f'write_overlay:{user_id}'
+
+
+def _insert(model, objects):
+    """
+    bulk_create, после которого у объектов есть pk, как после save():
+    обработчики post_save ниже на него опираются. SQLite ключи не
+    возвращает, поэтому они перечитываются: транзакция очереди держит
+    блокировку записи, и все строки с pk больше прежнего максимума —
+    только что вставленные, в порядке вставки.
+    """
+    if not objects:
+        return
+    if connection.features.can_return_ids_from_bulk_insert:
+        model.objects.bulk_create(objects, batch_size=500)
+        return
+    last = model.objects.order_by('-pk').values_list(
+        'pk', flat=True
+    ).first() or 0
+    model.objects.bulk_create(objects, batch_size=500)
+    ids = list(model.objects.filter(pk__gt=last).order_by(
+        'pk'
+    ).values_list('pk', flat=True))
+    if len(ids) != len(objects):
+        raise RuntimeError(
+            f'Вставлено {len(objects)} строк {model.__name__}, '
+            f'найдено {len(ids)}'
+        )
+    for instance, pk in zip(objects, ids):
+        instance.pk = pk
+
+
+def _cancel_key(user_id, author_id):
+    return f'write_cancel:{user_id}:{author_id}'
+
+
+def _cancelled(follows):
+    """
+    Подписки, отменённые отпиской после постановки в очередь: в любом
+    процессе, в том числе пока они уже забраны flush().
+    """
+    if not follows:
+        return set()
+    keys = {
+        _cancel_key(follow.user_id, follow.author_id) for follow in follows
+    }
+    markers = cache.get_many(keys)
+    # Несохранённые модели не хешируются, поэтому множество из id()
+    return {
+        id(follow) for follow in follows
+        if follow.queued_at <= markers.get(
+            _cancel_key(follow.user_id, follow.author_id), float('-inf')
+        )
+    }
+
+
+def _write(items):
+    comments = [item for item in items if isinstance(item, Comment)]
+    queued = [item for item in items if isinstance(item, Follow)]
+    # Метки отмены читаются внутри транзакции, уже взявшей блокировку
+    # записи: отписка, поставившая метку позже, удаляет подписку только
+    # после коммита и найдёт её
+    cancelled = _cancelled(queued)
+    follows = {}
+    for item in queued:
+        if id(item) not in cancelled:
+            follows.setdefault((item.user_id, item.author_id), item)
+    if follows:
+        existing = set(Follow.objects.filter(
+            user_id__in={user_id for user_id, _ in follows},
+            author_id__in={author_id for _, author_id in follows},
+        ).values_list('user_id', 'author_id'))
+        follows = [
+            follow for pair, follow in follows.items()
+            if pair not in existing
+        ]
+    created = 0
+    for model, objects in ((Comment, comments), (Follow, follows)):
+        _insert(model, objects)
+        for instance in objects:
+            post_save.send(
+                sender=model, instance=instance, created=True, raw=False,
+                using=connection.alias, update_fields=None,
+            )
+        created += len(objects)
+    return created
+
+
+class WriteQueue:
+    def __init__(self):
+        self._items = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def put(self, instance):
+        with self._lock:
+            self._items.append(instance)
+            full = len(self._items) >= batch_size()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='write-queue', daemon=True
+                )
+                self._thread.start()
+        if full:
+            self._wakeup.set()
+
+    def discard(self, predicate):
+        """Убирает из очереди ещё не записанные объекты."""
+        with self._lock:
+            removed = [item for item in self._items if predicate(item)]
+            self._items = [
+                item for item in self._items if not predicate(item)
+            ]
+        return removed
+
+    def __len__(self):
+        return len(self._items)
+
+    def flush(self):
+        """Записывает всё, что накопилось; возвращает число новых строк."""
+        with self._lock:
+            items, self._items = self._items, []
+        if not items:
+            return 0
+        try:
+            with transaction.atomic():
+                created = _write(items)
+        except Exception:
+            # Одна плохая запись (например, пост уже удалён) не должна
+            # отменять остальные
+            logger.exception('Ошибка пакетной записи, пишем по одной')
+            created = 0
+            for item in items:
+                try:
+                    with transaction.atomic():
+                        written = _write([item])
+                except Exception:
+                    # Внешние ключи SQLite проверяются при коммите,
+                    # поэтому считаем строку только после него
+                    logger.exception('Запись потеряна: %r', item)
+                else:
+                    created += written
+        _forget(items)
+        return created
+
+    def _run(self):
+        while True:
+            # Если очередь выключили, поток ждёт только явного сигнала
+            self._wakeup.wait(interval() / 1000 or None)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Ошибка очереди записи')
+
+
+_queue = WriteQueue()
+
+
+def flush():
+    return _queue.flush()
+
+
+atexit.register(flush)
+
+
+def _slot_key(user_id, slot):
+    return f'write_overlay:{user_id}:{slot}'
+
+
+def _remember(user_id, instance, entry):
+    """
+    Кладёт запись в overlay пользователя. У каждой записи свой ключ —
+    слот с номером из атомарного счётчика overlay_key, поэтому запрос
+    и поток записи не перетирают изменения друг друга.
+    """
+    key = overlay_key(user_id)
+    timeout = overlay_seconds()
+    while True:
+        cache.add(key, 0, timeout)
+        try:
+            slot = cache.incr(key)
+            break
+        except ValueError:
+            # Счётчик истёк между add и incr
+            continue
+    # Счётчик живёт, пока жив последний слот
+    cache.touch(key, timeout)
+    cache.set(_slot_key(user_id, slot), entry, timeout)
+    instance.write_slot = (user_id, slot)
+
+
+def _entries(user_id):
+    """Слоты overlay пользователя: {ключ: запись}."""
+    count = cache.get(overlay_key(user_id)) or 0
+    return cache.get_many([
+        _slot_key(user_id, slot) for slot in range(1, count + 1)
+    ])
+
+
+def _forget(items):
+    """Убирает записанные объекты из overlay их авторов."""
+    cache.delete_many([_slot_key(*item.write_slot) for item in items])
+
+
+def save_comment(comment):
+    """Сохраняет комментарий сразу или ставит его в очередь."""
+    if not interval():
+        with transaction.atomic():
+            comment.save()
+        return
+    _remember(comment.author_id, comment, ('comment', {
+        'post': comment.post_id,
+        'text': comment.text,
+        'created': timezone.now().isoformat(),
+    }))
+    _queue.put(comment)
+
+
+def follow(user, author):
+    """Подписывает user на author сразу или через очередь."""
+    if not interval():
+        Follow.objects.get_or_create(user=user, author=author)
+        return
+    instance = Follow(user=user, author=author)
+    instance.queued_at = time.time()
+    _remember(user.pk, instance, ('follow', author.pk))
+    _queue.put(instance)
+
+
+def cancel_follow(user, author):
+    """
+    Отменяет ещё не записанные подписки перед отпиской. Из очереди
+    процесса они просто убираются; для забранных flush() и поставленных
+    в других процессах остаётся метка в общем кэше, которую проверяет
+    _write.
+    """
+    if not interval():
+        return
+    cache.set(
+        _cancel_key(user.pk, author.pk), time.time(), CANCEL_SECONDS
+    )
+    _queue.discard(
+        lambda item: isinstance(item, Follow)
+        and item.user_id == user.pk and item.author_id == author.pk
+    )
+    cache.delete_many([
+        key for key, entry in _entries(user.pk).items()
+        if entry == ('follow', author.pk)
+    ])
+
+
+class Pending:
+    """Ещё не записанные комментарии и подписки пользователя."""
+
+    def __init__(self, user, entries=()):
+        self.user = user
+        self.comments = [
+            value for kind, value in entries if kind == 'comment'
+        ]
+        self.follows = {
+            value for kind, value in entries if kind == 'follow'
+        }
+
+    def __bool__(self):
+        return bool(self.comments or self.follows)
+
+    def apply_to_card(self, author):
+        """Учитывает ожидающую подписку в карточке из author_cards."""
+        if author.pk in self.follows and not author.is_followed:
+            author.is_followed = True
+            try:
+                author.stats.followers_count += 1
+            except AuthorStats.DoesNotExist:
+                # Как в шаблоне карточки: нет строки — нет и счётчиков
+                pass
+
+    def comments_for(self, post):
+        """Несохранённые объекты Comment к посту для шаблона."""
+        return [
+            Comment(
+                post=post, author=self.user, text=comment['text'],
+                created=parse_datetime(comment['created']),
+            )
+            for comment in self.comments
+            if comment['post'] == post.pk
+        ]
+
+
+def pending(user):
+    if not interval() or not user.is_authenticated:
+        return Pending(user)
+    return Pending(user, list(_entries(user.pk).values()))
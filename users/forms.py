@@ -1,10 +1,37 @@
+from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
+from django.urls import URLResolver, get_resolver
 
 User = get_user_model()
 
 
+def reserved_usernames(patterns=None):
+    """
+    Первые сегменты путей сайта. Профиль живёт по адресу /<username>/,
+    поэтому пользователь с таким именем оказался бы за страницей сайта.
+    """
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    names = set()
+    for pattern in patterns:
+        route = str(pattern.pattern).lstrip("^")
+        if not route and isinstance(pattern, URLResolver):
+            names |= reserved_usernames(pattern.url_patterns)
+            continue
+        segment = route.split("/")[0]
+        if segment and segment.replace("-", "").replace("_", "").isalnum():
+            names.add(segment)
+    return names
+
+
 class CreationForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
         model = User
         fields = ("first_name", "last_name", "username", "email")
+
+    def clean_username(self):
+        username = self.cleaned_data["username"]
+        if username in reserved_usernames():
+            raise forms.ValidationError("Это имя занято адресом сайта.")
+        return username
@@ -1,3 +1,29 @@
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from .forms import CreationForm
+
+
+class SignUpTest(TestCase):
+    def form(self, username):
+        return CreationForm(data={
+            "username": username,
+            "password1": "Pa55-word-signup",
+            "password2": "Pa55-word-signup",
+        })
+
+    def test_site_paths_are_reserved(self):
+        for username in ("search", "trending", "group"):
+            with self.subTest(username=username):
+                form = self.form(username)
+                self.assertFalse(form.is_valid())
+                self.assertIn("username", form.errors)
+        self.assertTrue(self.form("searcher").is_valid())
+
+    def test_signup(self):
+        response = self.client.post(reverse("signup"), {
+            "username": "new-user",
+            "password1": "Pa55-word-signup",
+            "password2": "Pa55-word-signup",
+        })
+        self.assertRedirects(response, reverse("login"))
@@ -10,7 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -46,10 +50,13 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'posts',
+    'core',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryCountMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +64,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -83,13 +91,47 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Соединения живут CONN_MAX_AGE секунд и переиспользуются между
+# запросами. WAL позволяет читать во время записи, а запись ждёт
+# блокировку до busy_timeout миллисекунд вместо немедленной ошибки
+# «database is locked». Подробности в core.db.backends.sqlite3.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.getenv('DJANGO_CONN_MAX_AGE', 600)),
+        'OPTIONS': {
+            'pragmas': {
+                'busy_timeout': 5000,
+                'journal_mode': 'wal',
+                'synchronous': 'normal',
+                'mmap_size': 256 * 1024 * 1024,
+                'cache_size': -64 * 1024,
+                'temp_store': 'memory',
+            },
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Реплики только для чтения лент, см. core.replicas. Локально реплика —
+# копия db.sqlite3, которую обновляет команда sync_replica.
+DATABASE_REPLICAS = []
+
+if os.getenv('DJANGO_REPLICA_DB'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DJANGO_REPLICA_DB'),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append('replica')
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+
+# Сколько секунд после записи клиент читает только из основной базы;
+# должно быть больше отставания реплик
+REPLICA_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -145,12 +187,61 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
+# Общий для всех процессов кэш в файле SQLite с вытеснением давно не
+# читанных записей, см. core.cache
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.getenv(
+            'DJANGO_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')
+        ),
+        'OPTIONS': {
+            'MAX_SIZE': 256 * 1024 * 1024,
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
 
+# Тестам — отдельный временный кэш, см. core.testing.isolated_cache
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# pytest не использует TEST_RUNNER: его тесты тоже не должны ни читать
+# страницы разработческого сервера из общего кэша, ни оставлять ему свои
+if 'pytest' in sys.modules:
+    _test_cache_dir = tempfile.mkdtemp(prefix='cache-')
+    atexit.register(shutil.rmtree, _test_cache_dir, ignore_errors=True)
+    CACHES['default']['LOCATION'] = os.path.join(
+        _test_cache_dir, 'cache.sqlite3'
+    )
+
+# Миниатюры картинок постов строятся заранее, в пуле из
+# POST_THUMBNAIL_WORKERS потоков (0 — сразу после коммита в том же потоке)
+POST_THUMBNAIL_PRESETS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True, 'quality': 80}),
+}
+
+# Варианты каждого пресета для srcset: ширины не больше исходной
+# картинки и форматы; первый формат — запасной для старых браузеров
+POST_THUMBNAIL_WIDTHS = (320, 480, 720, 960, 1440)
+
+POST_THUMBNAIL_FORMATS = ('JPEG', 'WEBP')
+
+POST_THUMBNAIL_WORKERS = 2
+
+# Картинки постов пишутся на диск и обрываются после POST_IMAGE_MAX_BYTES;
+# сохраняемая картинка уменьшается до POST_IMAGE_MAX_EDGE по длинной
+# стороне, см. posts.uploads
+POST_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+
+POST_IMAGE_MAX_PIXELS = 50_000_000
+
+POST_IMAGE_MAX_EDGE = 2048
+
+POST_IMAGE_QUALITY = 85
+
+# Страницы лент сбрасываются при записи, поэтому могут жить долго
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
 # LOGGING_CONFIG = None
 
 LOGGING = {
@@ -162,9 +253,12 @@ LOGGING = {
         },
     },
     'loggers': {
+        # На DEBUG при DEBUG = True печатается каждый запрос; для
+        # разбора медленных есть журнал из core/queries.py и команда
+        # slow_queries
         'django.db.backends': {
             'handlers': ['console'],
-            'level': os.getenv('DJANGO_LOG_LEVEL', 'DEBUG'),
+            'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
             'propagate': False,
         },
         'django.db': {
@@ -172,11 +266,73 @@ LOGGING = {
             'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
             'propagate': False,
         },
+        'core': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
+# Пакетная запись комментариев и подписок: раз в WRITE_QUEUE_INTERVAL мс
+# или по WRITE_QUEUE_BATCH штук одной транзакцией (0 — писать сразу)
+WRITE_QUEUE_INTERVAL = int(os.getenv('DJANGO_WRITE_QUEUE_MS', 0))
+
+WRITE_QUEUE_BATCH = 200
+
+WRITE_QUEUE_OVERLAY_SECONDS = 10
+
+# Сколько раз одна и та же форма запроса может выполниться за запрос,
+# прежде чем QueryCountMiddleware сообщит о возможном N+1.
+QUERY_REPEAT_THRESHOLD = 3
+
+# Журнал медленных запросов: запросы дольше SLOW_QUERY_MS мс и доля
+# SLOW_QUERY_SAMPLE_RATE остальных; сводку по формам показывает
+# команда slow_queries
+SLOW_QUERY_MS = int(os.getenv('DJANGO_SLOW_QUERY_MS', 100))
+
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv('DJANGO_SLOW_QUERY_SAMPLE', 0.001))
+
+SLOW_QUERY_MAX_FINGERPRINTS = 1000
+
+# Профили запросов сотрудников (?_profile=1 или =memory): сколько
+# последних хранить и сколько строк функций и выделений в каждом
+PROFILER_KEEP = 100
+
+# Дампы профилей лежат вне MEDIA_ROOT: их отдаёт только админка
+PRIVATE_MEDIA_ROOT = os.path.join(BASE_DIR, 'private')
+
+PROFILER_TOP = 40
+
+# Лимиты записей на пользователя (анонима — на IP): (burst, period) —
+# burst запросов подряд, затем один в period / burst секунд
+RATE_LIMITS = {
+    'post': (5, 60),
+    'comment': (20, 60),
+    'follow': (30, 60),
+}
+
 SITE_ID = 1
 
+# Лента подписок: авторы с большим числом подписчиков не раскладываются
+# по лентам при публикации, их посты подмешиваются при чтении.
+TIMELINE_FANOUT_LIMIT = 1000
+
+TIMELINE_BACKFILL_LIMIT = 500
+
+# Граф подписок в памяти каждого процесса догоняет журнал изменений
+# в кэше; полностью перечитывается из базы не реже раза в столько секунд
+FOLLOW_GRAPH_MAX_AGE = 60 * 60
+
+# Популярное: вклад поста и комментария уменьшается вдвое каждые
+# TRENDING_HALF_LIFE секунд; события старше TRENDING_WINDOW периодов
+# не учитываются. Таблицы пересчитывает rollup_trending --interval
+TRENDING_HALF_LIFE = 6 * 60 * 60
+
+TRENDING_WINDOW = 10
+
+TRENDING_POSTS_LIMIT = 1000
+
 GRAPH_MODELS = {
   'all_applications': True,
   'group_models': True,